@@ -0,0 +1,618 @@
+""" Benchmarks for ``tw`` startup and capsule pipeline overhead.
+
+Runs entirely against a stub ``task`` executable (see ``stub_task.py``)
+and a set of synthetic capsules registered through entry points in a
+temporary site directory, so no real Taskwarrior installation or task
+data is touched.  Each scenario records its median wall time and the
+number of ``task`` processes it started.
+
+Usage::
+
+    python benchmarks/run.py                # run and print results
+    python benchmarks/run.py --save         # also store them as the baseline
+    python benchmarks/run.py --check        # fail if results regressed
+
+The committed baseline only holds measures that do not depend on the
+machine running the benchmarks: ``task`` process counts, which must
+never exceed the baseline.  The ``import_*`` scenarios run a
+passthrough under ``python -X importtime``; with ``--check`` they fail
+if any of ``DEFERRED_MODULES`` was imported.
+
+Wall times are only compared against timings recorded on the same
+machine; pass ``--timings FILE`` along with ``--save`` to record them,
+and along with ``--check`` to compare against them with a relative
+tolerance (plus a small absolute allowance for very short scenarios).
+``--import-budget`` similarly bounds the total import time of a
+passthrough when given.
+
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import textwrap
+import time
+
+
+BENCHMARK_FOLDER = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY_FOLDER = os.path.dirname(BENCHMARK_FOLDER)
+DEFAULT_BASELINE = os.path.join(BENCHMARK_FOLDER, 'baseline.json')
+
+CAPSULE_VERSIONS = textwrap.dedent('''
+    MIN_VERSION = '0.1'
+    MAX_VERSION = '99.0'
+    MIN_TASKWARRIOR_VERSION = '2.0'
+    MAX_TASKWARRIOR_VERSION = '9.0'
+''')
+
+CAPSULE_TEMPLATES = {
+    'command': textwrap.dedent('''
+        from taskwarrior_capsules.capsule import CommandCapsule
+
+
+        class Capsule(CommandCapsule):
+            """ Synthetic benchmark command """
+            {versions}
+            def handle(self, filter_args, extra_args, **kwargs):
+                self.get_matching_tasks(filter_args)
+                return 0
+    '''),
+    'preprocessor': textwrap.dedent('''
+        from taskwarrior_capsules.capsule import CommandCapsule
+
+
+        class Capsule(CommandCapsule):
+            """ Synthetic benchmark preprocessor """
+            {versions}
+            def preprocess(self, filter_args, extra_args, **kwargs):
+                return filter_args, extra_args, kwargs['command_name']
+    '''),
+    'postprocessor': textwrap.dedent('''
+        from taskwarrior_capsules.capsule import CommandCapsule
+
+
+        class Capsule(CommandCapsule):
+            """ Synthetic benchmark postprocessor """
+            {versions}
+            def postprocess(self, filter_args, extra_args, **kwargs):
+                pass
+    '''),
+}
+
+# Modules a passthrough ``tw`` command must not import.
+DEFERRED_MODULES = (
+    'blessings',
+    'configobj',
+    'pkg_resources',
+    'pytz',
+    'taskw',
+    'verlib',
+)
+
+IMPORT_TIME_LINE = re.compile(
+    r'^import time:\s+(\d+) \|\s+(\d+) \|(\s+)(\S+)\s*$'
+)
+
+ENTRY_POINT_GROUPS = {
+    'command': 'taskwarrior_capsules',
+    'preprocessor': 'taskwarrior_preprocessor_capsules',
+    'postprocessor': 'taskwarrior_postprocessor_capsules',
+}
+
+
+class BenchmarkEnvironment(object):
+    """ A temporary home folder, stub ``task`` and synthetic capsules. """
+    def __init__(self, root, capsule_count):
+        self.root = root
+        self.home = os.path.join(root, 'home')
+        self.bin = os.path.join(root, 'bin')
+        self.site = os.path.join(root, 'site')
+        self.cache = os.path.join(root, 'cache')
+        self.data = os.path.join(self.home, '.task')
+        self.task_log = os.path.join(root, 'task.log')
+        self.capsule_count = capsule_count
+        self.task_count = 1000
+
+        for folder in (self.home, self.bin, self.site, self.cache, self.data):
+            os.makedirs(folder)
+        with open(os.path.join(self.home, '.taskrc'), 'w') as out:
+            out.write('data.location=%s\n' % self.data)
+
+        self._write_stub_task()
+        self._write_capsules()
+
+    def _write_stub_task(self):
+        path = os.path.join(self.bin, 'task')
+        with open(path, 'w') as out:
+            out.write('#!/bin/sh\nexec "%s" "%s" "$@"\n' % (
+                sys.executable,
+                os.path.join(BENCHMARK_FOLDER, 'stub_task.py'),
+            ))
+        os.chmod(path, 0o755)
+
+    def _write_capsules(self):
+        entry_points = []
+        for variant, group in ENTRY_POINT_GROUPS.items():
+            entry_points.append('[%s]' % group)
+            for i in range(self.capsule_count):
+                module = 'bench_%s_%s' % (variant, i)
+                with open(os.path.join(self.site, module + '.py'), 'w') as out:
+                    out.write(
+                        CAPSULE_TEMPLATES[variant].replace(
+                            '{versions}',
+                            CAPSULE_VERSIONS.replace('\n', '\n    '),
+                        )
+                    )
+                entry_points.append('bench_%s_%s = %s:Capsule' % (
+                    variant, i, module,
+                ))
+            entry_points.append('')
+
+        dist_info = os.path.join(self.site, 'benchcapsules-1.0.dist-info')
+        os.makedirs(dist_info)
+        with open(os.path.join(dist_info, 'METADATA'), 'w') as out:
+            out.write(
+                'Metadata-Version: 2.1\nName: benchcapsules\nVersion: 1.0\n'
+            )
+        with open(os.path.join(dist_info, 'entry_points.txt'), 'w') as out:
+            out.write('\n'.join(entry_points))
+
+    @property
+    def metadata_folder(self):
+        return os.path.join(self.home, '.taskwarrior-capsules')
+
+    def clear_metadata(self):
+        shutil.rmtree(self.metadata_folder, ignore_errors=True)
+
+    def environ(self, capsules=True):
+        env = os.environ.copy()
+        env.pop('TW_CAPSULES_PROFILE', None)
+        python_path = [REPOSITORY_FOLDER]
+        if capsules:
+            python_path.append(self.site)
+        env.update({
+            'HOME': self.home,
+            'PATH': self.bin + os.pathsep + env.get('PATH', ''),
+            'PYTHONPATH': os.pathsep.join(python_path),
+            'TASKRC': os.path.join(self.home, '.taskrc'),
+            'BENCH_TASK_LOG': self.task_log,
+            'BENCH_TASK_COUNT': str(self.task_count),
+            'BENCH_CACHE_FOLDER': self.cache,
+        })
+        return env
+
+    def activate(self):
+        """ Makes this process use the benchmark environment. """
+        os.environ.update(self.environ())
+        sys.path[0:0] = [REPOSITORY_FOLDER, self.site]
+
+    def count_task_processes(self):
+        try:
+            with open(self.task_log, 'r') as in_:
+                return sum(1 for _ in in_)
+        except IOError:
+            return 0
+
+    def reset_task_log(self):
+        with open(self.task_log, 'w'):
+            pass
+
+
+def measure(function, repeat, setup=None):
+    """ Returns the median wall time of ``function`` over ``repeat`` runs,
+    along with the number of ``task`` processes started per run. """
+    timings = []
+    processes = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        environment.reset_task_log()
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+        processes.append(environment.count_task_processes())
+    return {
+        'wall': statistics.median(timings),
+        'task_processes': max(processes),
+    }
+
+
+def run_tw(*args, **kwargs):
+    subprocess.check_call(
+        [
+            sys.executable,
+            '-c',
+            'import sys; '
+            'from taskwarrior_capsules.cmdline import main; '
+            'main(sys.argv[1:])',
+        ] + list(args),
+        env=environment.environ(**kwargs),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+def startup_scenarios(repeat):
+    results = {}
+    results['startup_cold_passthrough'] = measure(
+        lambda: run_tw('next'),
+        repeat,
+        setup=environment.clear_metadata,
+    )
+    run_tw('next')
+    results['startup_warm_passthrough'] = measure(
+        lambda: run_tw('next'),
+        repeat,
+    )
+    results['startup_warm_capsule_command'] = measure(
+        lambda: run_tw('bench_command_0'),
+        repeat,
+    )
+    # Without any capsules installed, ``tw`` execs ``task`` directly.
+    run_tw('next', capsules=False)
+    results['startup_warm_exec_passthrough'] = measure(
+        lambda: run_tw('next', capsules=False),
+        repeat,
+    )
+    run_tw('next')
+    return results
+
+
+def measure_imports():
+    """ Runs a warm passthrough under ``-X importtime``.
+
+    Returns the total import time in seconds and the top-level names of
+    the modules imported.
+
+    """
+    output = subprocess.run(
+        [
+            sys.executable,
+            '-X',
+            'importtime',
+            '-c',
+            'from taskwarrior_capsules.cmdline import main; main(["next"])',
+        ],
+        env=environment.environ(),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        check=True,
+    ).stderr.decode('utf-8', 'replace')
+
+    total = 0
+    modules = set()
+    for line in output.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match is None:
+            continue
+        total += int(match.group(1))
+        modules.add(match.group(4).split('.')[0])
+    return total / 1000000.0, modules
+
+
+def import_scenarios(repeat):
+    run_tw('next')
+    timings = []
+    imported = set()
+    for _ in range(repeat):
+        environment.reset_task_log()
+        total, modules = measure_imports()
+        timings.append(total)
+        imported |= modules
+    return {
+        'import_warm_passthrough': {
+            'wall': statistics.median(timings),
+            'task_processes': environment.count_task_processes(),
+            'deferred_modules': sorted(
+                set(DEFERRED_MODULES) & imported
+            ),
+        }
+    }
+
+
+def api_scenarios(sizes, repeat):
+    import datetime
+
+    from taskwarrior_capsules.capsule import CommandCapsule
+    from taskwarrior_capsules.capsule_meta import CapsuleMeta
+    from taskwarrior_capsules.client import CapsuleClient
+    from taskwarrior_capsules import taskwarrior
+
+    import stub_task
+
+    class BenchCapsule(CommandCapsule):
+        MIN_VERSION = '0.1'
+        MAX_VERSION = '99.0'
+        MIN_TASKWARRIOR_VERSION = '2.0'
+        MAX_TASKWARRIOR_VERSION = '9.0'
+
+    class BenchDataCapsule(BenchCapsule):
+        READ_BACKEND = 'data'
+
+    meta = CapsuleMeta()
+
+    def make_capsule(capsule_class=BenchCapsule):
+        return capsule_class(meta, 'bench', CapsuleClient(marshal=True))
+
+    results = {}
+    since = datetime.datetime(2020, 6, 1)
+    for size in sizes:
+        environment.task_count = size
+        os.environ['BENCH_TASK_COUNT'] = str(size)
+        # Generate (and cache) the stub's export up-front.
+        subprocess.check_call(
+            ['task', 'export'],
+            env=environment.environ(),
+            stdout=subprocess.DEVNULL,
+        )
+        with open(os.path.join(environment.data, 'pending.data'), 'w') as out:
+            out.write(stub_task.build_data_file(size))
+
+        capsule = {}
+
+        def setup():
+            capsule['instance'] = make_capsule()
+
+        results['get_matching_tasks_%s' % size] = measure(
+            lambda: capsule['instance'].get_matching_tasks([]),
+            repeat,
+            setup=setup,
+        )
+        results['iter_matching_tasks_%s' % size] = measure(
+            lambda: sum(1 for _ in capsule['instance'].iter_matching_tasks([])),
+            repeat,
+            setup=setup,
+        )
+        results['get_tasks_changed_since_%s' % size] = measure(
+            lambda: capsule['instance'].get_tasks_changed_since(since),
+            repeat,
+            setup=setup,
+        )
+        results['get_matching_tasks_compact_%s' % size] = measure(
+            lambda: capsule['instance'].get_matching_tasks([], compact=True),
+            repeat,
+            setup=setup,
+        )
+
+        def setup_data():
+            capsule['instance'] = make_capsule(BenchDataCapsule)
+
+        # The first read parses the data file; later ones hit the cache.
+        setup_data()
+        results['get_matching_tasks_data_cold_%s' % size] = measure(
+            lambda: capsule['instance'].get_matching_tasks([]),
+            1,
+        )
+        results['get_matching_tasks_data_%s' % size] = measure(
+            lambda: capsule['instance'].get_matching_tasks([]),
+            repeat,
+            setup=setup_data,
+        )
+        results['get_tasks_changed_since_data_%s' % size] = measure(
+            lambda: capsule['instance'].get_tasks_changed_since(since),
+            repeat,
+            setup=setup_data,
+        )
+
+    def clear_verdicts():
+        setup()
+        BenchCapsule._compatibility_cache.clear()
+        for name in ('compatibility', 'taskwarrior_version'):
+            try:
+                os.unlink(meta.get_cache(name).path)
+            except OSError:
+                pass
+        taskwarrior._version_cache.clear()
+
+    capsule = {}
+
+    def setup():
+        capsule['instance'] = make_capsule()
+
+    results['validate_cold'] = measure(
+        lambda: capsule['instance'].validate(variant='command'),
+        repeat,
+        setup=clear_verdicts,
+    )
+    results['validate_warm'] = measure(
+        lambda: capsule['instance'].validate(variant='command'),
+        repeat,
+        setup=setup,
+    )
+    return results
+
+
+def check_imports(results, budget):
+    regressions = []
+    for name, result in sorted(results.items()):
+        if 'deferred_modules' not in result:
+            continue
+        if result['deferred_modules']:
+            regressions.append(
+                '%s: imported %s' % (
+                    name, ', '.join(result['deferred_modules']),
+                )
+            )
+        if budget is not None and result['wall'] > budget:
+            regressions.append(
+                '%s: imports took %.1fms (budget %.1fms)' % (
+                    name, result['wall'] * 1000, budget * 1000,
+                )
+            )
+    return regressions
+
+
+def compare(results, baseline):
+    regressions = []
+    for name, result in sorted(results.items()):
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+        if result['task_processes'] > expected['task_processes']:
+            regressions.append(
+                '%s: started %s task processes (baseline %s)' % (
+                    name,
+                    result['task_processes'],
+                    expected['task_processes'],
+                )
+            )
+    return regressions
+
+
+def compare_timings(results, timings, tolerance, allowance):
+    regressions = []
+    for name, result in sorted(results.items()):
+        expected = timings.get(name)
+        if expected is None:
+            continue
+        if result['wall'] > expected['wall'] * tolerance + allowance:
+            regressions.append(
+                '%s: took %.1fms (baseline %.1fms)' % (
+                    name,
+                    result['wall'] * 1000,
+                    expected['wall'] * 1000,
+                )
+            )
+    return regressions
+
+
+def save(path, data):
+    with open(path, 'w') as out:
+        json.dump(data, out, indent=4, sort_keys=True)
+        out.write('\n')
+
+
+def print_results(results):
+    width = max(len(name) for name in results)
+    print('%s  %10s  %5s' % ('Scenario'.ljust(width), 'Wall (ms)', 'task'))
+    for name, result in sorted(results.items()):
+        print('%s  %10.1f  %5s' % (
+            name.ljust(width),
+            result['wall'] * 1000,
+            result['task_processes'],
+        ))
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument(
+        '--sizes',
+        default='1000,10000',
+        help=(
+            'Comma-separated numbers of tasks the stub should export '
+            '(default: %(default)s; add 100000 for a long run).'
+        ),
+    )
+    parser.add_argument(
+        '--capsules',
+        type=int,
+        default=5,
+        help='Number of synthetic capsules of each variant to install.',
+    )
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument(
+        '--timings',
+        help=(
+            'File holding wall times recorded on this machine, which '
+            '--save writes and --check compares against.'
+        ),
+    )
+    parser.add_argument(
+        '--save',
+        action='store_true',
+        help='Store the results as the new baseline.',
+    )
+    parser.add_argument(
+        '--check',
+        action='store_true',
+        help='Exit with a non-zero status if results regressed.',
+    )
+    parser.add_argument('--tolerance', type=float, default=1.5)
+    parser.add_argument(
+        '--allowance',
+        type=float,
+        default=0.05,
+        help='Seconds any scenario may exceed its tolerance by.',
+    )
+    parser.add_argument(
+        '--import-budget',
+        type=float,
+        help=(
+            'Milliseconds a passthrough may spend importing modules on '
+            'this machine.'
+        ),
+    )
+    options = parser.parse_args(args)
+
+    global environment
+    root = tempfile.mkdtemp(prefix='tw-capsules-benchmark-')
+    try:
+        environment = BenchmarkEnvironment(root, options.capsules)
+        environment.activate()
+
+        results = {}
+        results.update(startup_scenarios(options.repeat))
+        results.update(import_scenarios(options.repeat))
+        results.update(
+            api_scenarios(
+                [int(size) for size in options.sizes.split(',') if size],
+                options.repeat,
+            )
+        )
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    print_results(results)
+
+    status = 0
+    if options.check:
+        try:
+            with open(options.baseline, 'r') as in_:
+                baseline = json.load(in_)
+        except IOError:
+            print("No baseline found at %s." % options.baseline)
+            return 1
+        regressions = compare(results, baseline)
+        if options.timings:
+            try:
+                with open(options.timings, 'r') as in_:
+                    timings = json.load(in_)
+            except IOError:
+                print("No timings found at %s." % options.timings)
+                return 1
+            regressions.extend(compare_timings(
+                results, timings, options.tolerance, options.allowance,
+            ))
+        budget = options.import_budget
+        regressions.extend(check_imports(
+            results, budget / 1000.0 if budget is not None else None,
+        ))
+        for regression in regressions:
+            print('REGRESSION: %s' % regression)
+        status = 1 if regressions else 0
+
+    if options.save:
+        save(options.baseline, dict(
+            (name, {'task_processes': result['task_processes']})
+            for name, result in results.items()
+        ))
+        if options.timings:
+            save(options.timings, dict(
+                (name, {'wall': result['wall']})
+                for name, result in results.items()
+            ))
+
+    return status
+
+
+environment = None
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,99 @@
+""" A stand-in for the ``task`` executable used by the benchmarks.
+
+Every invocation is appended to the file named by ``BENCH_TASK_LOG``.
+``export`` commands print a synthetic JSON array of ``BENCH_TASK_COUNT``
+pending tasks (filters are ignored); every other command succeeds
+without output.  ``build_data_file`` renders the same tasks in
+taskwarrior's ``pending.data`` format.
+
+"""
+import calendar
+import datetime
+import json
+import os
+import sys
+
+
+VERSION = '2.6.2'
+
+
+DATE_FORMAT = '%Y%m%dT%H%M%SZ'
+DATE_FIELDS = ('due', 'entry', 'modified', )
+
+
+def build_tasks(count):
+    tasks = []
+    for i in range(count):
+        task = {
+            'id': i + 1,
+            'uuid': '%08x-0000-4000-8000-%012x' % (i, i),
+            'description': 'Synthetic task number %s' % i,
+            'status': 'pending',
+            'entry': '20200101T000000Z',
+            'modified': '2020%02d%02dT120000Z' % (i % 12 + 1, i % 28 + 1),
+            'project': 'project%s' % (i % 20),
+            'tags': ['tag%s' % (i % 7), 'tag%s' % (i % 11)],
+            'urgency': round((i % 100) / 10.0, 1),
+        }
+        if i % 3 == 0:
+            task['due'] = '2021%02d%02dT000000Z' % (i % 12 + 1, i % 28 + 1)
+        tasks.append(task)
+    return tasks
+
+
+def build_export(count):
+    return json.dumps(build_tasks(count))
+
+
+def build_data_file(count):
+    lines = []
+    for task in build_tasks(count):
+        fields = []
+        for key, value in sorted(task.items()):
+            if key in ('id', 'urgency', ):
+                continue
+            if key in DATE_FIELDS:
+                value = calendar.timegm(
+                    datetime.datetime.strptime(value, DATE_FORMAT).timetuple()
+                )
+            elif key == 'tags':
+                value = ','.join(value)
+            fields.append('%s:"%s"' % (key, value))
+        lines.append('[%s]\n' % ' '.join(fields))
+    return ''.join(lines)
+
+
+def get_export(count):
+    """ Returns the export for ``count`` tasks, caching it on disk. """
+    cache_folder = os.environ.get('BENCH_CACHE_FOLDER')
+    if not cache_folder:
+        return build_export(count)
+    path = os.path.join(cache_folder, 'export-%s.json' % count)
+    try:
+        with open(path, 'r') as in_:
+            return in_.read()
+    except IOError:
+        export = build_export(count)
+        with open(path, 'w') as out:
+            out.write(export)
+        return export
+
+
+def main(args):
+    log_path = os.environ.get('BENCH_TASK_LOG')
+    if log_path:
+        with open(log_path, 'a') as log:
+            log.write(json.dumps(args) + '\n')
+
+    if '--version' in args:
+        sys.stdout.write(VERSION + '\n')
+    elif 'export' in args:
+        sys.stdout.write(
+            get_export(int(os.environ.get('BENCH_TASK_COUNT', '1000')))
+        )
+        sys.stdout.write('\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
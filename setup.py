@@ -62,7 +62,8 @@ setup(
     packages=find_packages(),
     entry_points={
         'console_scripts': [
-            'tw = taskwarrior_capsules.cmdline:main'
+            'tw = taskwarrior_capsules.cmdline:main',
+            'tw-client = taskwarrior_capsules.daemon:client_main',
         ],
         'taskwarrior_capsules': [
             'capsules = taskwarrior_capsules.commands.main:Capsules',
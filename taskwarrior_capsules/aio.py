@@ -0,0 +1,105 @@
+""" An asyncio flavour of the taskwarrior client.
+
+Capsules implementing ``handle``, ``preprocess`` or ``postprocess`` as
+coroutines are run on an event loop by ``CommandCapsule.execute``, and
+can use ``self.async_client`` to run many taskwarrior commands at once::
+
+    async def handle(self, filter_args, extra_args, **kwargs):
+        counts = await asyncio.gather(*[
+            self.async_client.export('project:%s' % project)
+            for project in projects
+        ])
+
+At most ``concurrency`` ``task`` processes run at the same time.
+
+"""
+import asyncio
+import json
+import os
+
+from taskw.exceptions import TaskwarriorError
+
+from .export import get_export_command
+from .snapshot import args_may_mutate
+
+
+DEFAULT_CONCURRENCY = 8
+
+
+class AsyncCapsuleClient(object):
+    """ Runs taskwarrior commands for ``client`` without blocking.
+
+    Export results are shared with ``client`` through its snapshot
+    cache, and tasks are marshalled exactly as ``client`` would.
+
+    """
+    def __init__(self, client, concurrency=DEFAULT_CONCURRENCY):
+        self.client = client
+        self.concurrency = max(concurrency, 1)
+        self._loop = None
+        self._semaphore = None
+
+    @property
+    def semaphore(self):
+        # Each ``asyncio.run`` uses a new event loop; semaphores must
+        # not be shared between them.
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._semaphore
+
+    async def execute(self, *args):
+        """ Executes a taskwarrior command; returns (stdout, stderr). """
+        command = get_export_command(self.client, *args)
+        env = os.environ.copy()
+        env['TASKRC'] = self.client.config_filename
+
+        try:
+            async with self.semaphore:
+                proc = await asyncio.create_subprocess_exec(
+                    *command,
+                    env=env,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE,
+                )
+                stdout, stderr = await proc.communicate()
+        finally:
+            if args_may_mutate(args):
+                self.client.snapshots.invalidate()
+
+        if proc.returncode != 0:
+            raise TaskwarriorError(command, stderr, stdout, proc.returncode)
+
+        encoding = self.client.config.get('encoding', 'utf-8')
+        return (
+            stdout.decode(encoding, 'replace'),
+            stderr.decode(encoding, 'replace'),
+        )
+
+    async def get_json(self, *args):
+        snapshots = self.client.snapshots
+        if not snapshots.is_cacheable(args):
+            return json.loads((await self.execute(*args))[0])
+
+        snapshot = snapshots.get(args)
+        if snapshot is None:
+            generation = snapshots.generation
+            snapshot = (await self.execute(*args))[0]
+            snapshots.set(args, snapshot, generation=generation)
+        return json.loads(snapshot)
+
+    async def get_task_objects(self, *args):
+        tasks = await self.get_json(*args)
+        if isinstance(tasks, dict):
+            return self.client._get_task_object(tasks)
+        return [self.client._get_task_object(task) for task in tasks]
+
+    async def export(self, *filter_args):
+        """ Returns the pending tasks matching ``filter_args``. """
+        tasks = await self.get_task_objects(
+            *(list(filter_args) + ['status:pending', 'export'])
+        )
+        if isinstance(tasks, dict):
+            tasks = [tasks]
+        return tasks
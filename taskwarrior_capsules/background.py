@@ -0,0 +1,61 @@
+""" Worker process running postprocessors after ``tw`` has exited.
+
+Started by ``cmdline.spawn_background_postprocessors``; reads a JSON
+payload describing the pipeline state from standard input.
+
+"""
+import datetime
+import json
+import sys
+
+from blessings import Terminal
+
+from .capsule_meta import CapsuleMeta
+from .client import CapsuleClient
+from .cmdline import report_capsule_error, run_postprocessors
+from .registry import LazyCapsuleMapping
+
+
+def main():
+    payload = json.loads(sys.stdin.read())
+
+    term = Terminal()
+    meta = CapsuleMeta()
+    client = CapsuleClient(marshal=True)
+
+    installed = LazyCapsuleMapping('postprocessor', meta, client)
+    postprocessors = dict(
+        (name, installed[name])
+        for name in payload['capsules']
+        if installed.get(name) is not None
+    )
+
+    print(
+        '[%s] Running %s after %r (result %s)' % (
+            datetime.datetime.now().isoformat(),
+            ', '.join(sorted(postprocessors)),
+            payload['command_name'],
+            payload['result'],
+        )
+    )
+    sys.stdout.flush()
+
+    errors = run_postprocessors(
+        postprocessors,
+        allow_background=False,
+        meta=meta,
+        command_name=payload['command_name'],
+        filter_args=payload['filter_args'],
+        extra_args=payload['extra_args'],
+        terminal=term,
+        result=payload['result'],
+    )
+    for processor_name, exception in errors:
+        report_capsule_error(term, processor_name, exception)
+    sys.stdout.flush()
+
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+""" Applying many task changes with a handful of ``task import`` runs.
+
+Each ``task_add`` or ``task_update`` call on a taskw client starts at
+least one ``task`` process; altering thousands of tasks that way takes
+minutes.  ``TaskChangeBatch`` instead collects the complete, altered
+tasks and imports them ``chunk_size`` at a time, reading the results
+back with one ``export`` per chunk.
+
+"""
+import collections
+import datetime
+import json
+import os
+import tempfile
+import uuid
+
+from taskw.exceptions import TaskwarriorError
+from taskw.fields import DateField
+
+from .data import DATE_FORMAT
+from .index import to_export
+
+
+DEFAULT_CHUNK_SIZE = 500
+
+
+BatchResult = collections.namedtuple(
+    'BatchResult', ['uuid', 'task', 'success', 'error', ]
+)
+BatchResult.__doc__ = """ The outcome of one change in a batch.
+
+``task`` is the task as read back from taskwarrior (``None`` if the
+change failed), and ``error`` a message explaining why it failed.
+
+"""
+
+
+def serialize_value(value):
+    """ Serializes values ``json`` cannot, as ``taskw`` would have.
+
+    Tasks of clients not marshalling their data hold whatever values
+    they were given, e.g. datetimes.
+
+    """
+    if isinstance(value, (datetime.datetime, datetime.date, )):
+        return DateField().serialize(value)
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    raise TypeError(
+        'Object of type %s is not JSON serializable' % type(value).__name__
+    )
+
+
+def get_error_message(error):
+    # ``TaskwarriorError.__str__`` returns bytes on Python 3.
+    if isinstance(error, TaskwarriorError):
+        return error.stderr or error.stdout
+    return str(error)
+
+
+class TaskChangeBatch(object):
+    """ Collects task additions and modifications for ``client``. """
+    def __init__(self, client, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.client = client
+        self.chunk_size = max(chunk_size, 1)
+        self.pending = collections.OrderedDict()
+        self.results = []
+
+    def __len__(self):
+        return len(self.pending)
+
+    def add(self, description, tags=None, **kwargs):
+        """ Queues a new task; returns the uuid it will be given.
+
+        Accepts the same arguments as ``client.task_add``.
+
+        """
+        task = self.client._get_task_object({})
+        task['description'] = description
+        if tags:
+            task['tags'] = tags
+        for key, value in kwargs.items():
+            task[key] = value
+
+        exported = dict(to_export(task))
+        exported.setdefault('uuid', str(uuid.uuid4()))
+        exported.setdefault('status', 'pending')
+        exported.setdefault(
+            'entry', datetime.datetime.utcnow().strftime(DATE_FORMAT)
+        )
+        self.pending[exported['uuid']] = exported
+        return exported['uuid']
+
+    def update(self, task):
+        """ Queues ``task``, a complete (altered) task, to be saved.
+
+        Accepts the same tasks as ``client.task_update``; queueing the
+        same task twice only saves its latest state.
+
+        """
+        exported = dict(to_export(task))
+        if 'uuid' not in exported:
+            raise KeyError('Task must have a UUID to be updated.')
+        exported['uuid'] = str(exported['uuid'])
+        exported.pop('id', None)
+        exported.pop('urgency', None)
+        self.pending[exported['uuid']] = exported
+
+    def import_tasks(self, tasks):
+        """ Runs ``task import`` for ``tasks``; returns its error, if any."""
+        handle, path = tempfile.mkstemp(suffix='.json')
+        try:
+            with os.fdopen(handle, 'w') as out:
+                json.dump(tasks, out, default=serialize_value)
+            self.client._execute('import', path)
+        except (TaskwarriorError, TypeError, ValueError) as e:
+            return e
+        finally:
+            os.unlink(path)
+        return None
+
+    def apply_chunk(self, tasks):
+        error = self.import_tasks(tasks)
+        errors = {}
+        if error is not None and len(tasks) > 1:
+            # Find out which of the chunk's tasks were at fault.
+            for task in tasks:
+                task_error = self.import_tasks([task])
+                if task_error is not None:
+                    errors[task['uuid']] = get_error_message(task_error)
+        elif error is not None:
+            errors[tasks[0]['uuid']] = get_error_message(error)
+
+        stored = {}
+        for task in self.client._get_task_objects(
+            *([task['uuid'] for task in tasks] + ['export'])
+        ):
+            stored[str(task['uuid'])] = task
+
+        results = []
+        for task in tasks:
+            uuid = task['uuid']
+            if uuid in stored and uuid not in errors:
+                results.append(BatchResult(uuid, stored[uuid], True, None))
+            else:
+                results.append(BatchResult(
+                    uuid,
+                    None,
+                    False,
+                    errors.get(uuid, 'Task was not found after import.'),
+                ))
+        return results
+
+    def apply(self):
+        """ Imports every queued change; returns a ``BatchResult`` each. """
+        tasks = list(self.pending.values())
+        self.pending.clear()
+
+        before = self.client.snapshots.generation
+        results = []
+        for start in range(0, len(tasks), self.chunk_size):
+            results.extend(
+                self.apply_chunk(tasks[start:start + self.chunk_size])
+            )
+        if tasks:
+            self.client.notify_tasks_changed(
+                [result.task for result in results if result.success],
+                before,
+            )
+
+        self.results.extend(results)
+        return results
@@ -0,0 +1,161 @@
+import hashlib
+import io
+import json
+import os
+import pickle
+import tempfile
+import threading
+
+
+def atomic_write(path, data):
+    """ Write ``data`` (bytes) to ``path`` without exposing partial files.
+
+    The data is written to a temporary file in the destination folder
+    and then moved into place, so concurrent readers only ever see
+    either the previous or the new contents.
+
+    """
+    fd, temporary_path = tempfile.mkstemp(
+        dir=os.path.dirname(path) or '.',
+        prefix='.tmp-',
+    )
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            out.write(data)
+        os.replace(temporary_path, path)
+    except BaseException:
+        try:
+            os.unlink(temporary_path)
+        except OSError:
+            pass
+        raise
+
+
+class JSONCache(object):
+    """ A small JSON document persisted in the metadata folder.
+
+    Caches are strictly advisory: a missing, unreadable or corrupt
+    file loads as an empty dictionary, and failing to save one is
+    silently ignored.
+
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as in_:
+                data = json.load(in_)
+        except (IOError, OSError, ValueError):
+            return {}
+        if not isinstance(data, dict):
+            return {}
+        return data
+
+    def save(self, data):
+        try:
+            atomic_write(
+                self.path,
+                json.dumps(data, sort_keys=True).encode('utf-8'),
+            )
+        except (IOError, OSError):
+            return False
+        return True
+
+
+# path -> (signature, ConfigObj) for configuration files loaded so far.
+_configs = {}
+_configs_lock = threading.Lock()
+
+
+def get_file_signature(path):
+    """ Returns a value that changes whenever ``path`` is modified. """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_size, stat.st_mtime_ns, )
+
+
+class ConfigCache(object):
+    """ Parsed ``ConfigObj`` files, shared in-process and pickled to disk.
+
+    ``load`` only parses a configuration file when it has changed since
+    it was last parsed by any process; otherwise the ``ConfigObj`` is
+    returned from memory or unpickled from ``folder``.  Loaded objects
+    are shared by everything in the process loading the same file.
+
+    """
+    def __init__(self, folder):
+        self.folder = folder
+
+    def get_pickle_path(self, path):
+        return os.path.join(
+            self.folder,
+            'config.%s.%s.pickle' % (
+                os.path.basename(path),
+                hashlib.sha1(
+                    os.path.abspath(path).encode('utf-8')
+                ).hexdigest()[:12],
+            )
+        )
+
+    def load_pickle(self, path, signature):
+        try:
+            with open(self.get_pickle_path(path), 'rb') as in_:
+                cached_path, cached_signature, config = pickle.load(in_)
+        except Exception:
+            return None
+        if (cached_path, cached_signature, ) != (path, signature, ):
+            return None
+        return config
+
+    def save_pickle(self, path, signature, config):
+        if signature is None:
+            return
+        try:
+            atomic_write(
+                self.get_pickle_path(path),
+                pickle.dumps(
+                    (path, signature, config, ),
+                    pickle.HIGHEST_PROTOCOL,
+                ),
+            )
+        except (IOError, OSError, pickle.PicklingError):
+            pass
+
+    def load(self, path):
+        """ Returns the ``ConfigObj`` for ``path``. """
+        path = os.path.abspath(path)
+        signature = get_file_signature(path)
+        with _configs_lock:
+            cached = _configs.get(path)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+
+        config = self.load_pickle(path, signature)
+        if config is None:
+            from configobj import ConfigObj
+            config = ConfigObj(path)
+            self.save_pickle(path, signature, config)
+
+        with _configs_lock:
+            _configs[path] = (signature, config, )
+        return config
+
+    def save(self, config):
+        """ Atomically writes ``config`` to its file.
+
+        The cached copy is kept, so the next ``load`` need not parse the
+        file again.
+
+        """
+        path = os.path.abspath(config.filename)
+        output = io.BytesIO()
+        config.write(output)
+        atomic_write(path, output.getvalue())
+
+        signature = get_file_signature(path)
+        with _configs_lock:
+            _configs[path] = (signature, config, )
+        self.save_pickle(path, signature, config)
@@ -1,33 +1,53 @@
+import contextlib
 import datetime
-import subprocess
+import os
+import sys
+import types
 import warnings
 
-from configobj import ConfigObj
-import pytz
-from verlib import NormalizedVersion
-
 from . import __version__
+from .data import DATE_FORMAT
 from .exceptions import CapsuleProgrammingError
+from .profiling import get_profiler
+from .taskwarrior import get_taskwarrior_version_string
+
+
+# Used for tasks that record neither when they were modified nor entered.
+UNKNOWN_MODIFICATION_TIME = datetime.datetime(
+    2000, 1, 1, tzinfo=datetime.timezone.utc
+)
+
+
+# configobj, pytz and verlib are imported where they are used rather
+# than here; most ``tw`` invocations never need them.
 
 
 class TaskwarriorCapsuleBase(object):
+    # Compatibility verdicts (lists of warning messages) already
+    # computed in this process; see ``validate``.
+    _compatibility_cache = {}
+
     def get_taskwarrior_version(self):
-        taskwarrior_version = subprocess.Popen(
-            ['task', '--version'],
-            stdout=subprocess.PIPE
-        ).communicate()[0]
-        return NormalizedVersion(taskwarrior_version)
+        from verlib import NormalizedVersion
+        return NormalizedVersion(
+            get_taskwarrior_version_string(getattr(self, 'meta', None))
+        )
 
     def get_taskwarrior_capsules_version(self):
+        from verlib import NormalizedVersion
         return NormalizedVersion(__version__)
 
-    def validate(self, **kwargs):
+    def get_compatibility_warnings(self):
+        from verlib import NormalizedVersion
+
+        messages = []
+
         if not (self.MIN_VERSION and self.MAX_VERSION):
-            warnings.warn(
+            messages.append(
                 "Capsule '%s' does not specify compatible which "
                 "taskwarrior-capsule versions it is compatible with; you may "
                 "encounter compatibility problems. " % (
-                    self.command_name
+                    self.capsule_name
                 )
             )
         else:
@@ -36,12 +56,12 @@ class TaskwarriorCapsuleBase(object):
             max_version = NormalizedVersion(self.MAX_VERSION)
 
             if not min_version <= curr_version <= max_version:
-                warnings.warn(
+                messages.append(
                     "Capsule '%s' is not compatible with version %s of "
                     "taskwarrior-capsules; "
                     "minimum version: %s; "
                     "maximum version %s." % (
-                        self.command_name,
+                        self.capsule_name,
                         __version__,
                         min_version,
                         max_version,
@@ -55,11 +75,11 @@ class TaskwarriorCapsuleBase(object):
         elif not (
             self.MAX_TASKWARRIOR_VERSION and self.MIN_TASKWARRIOR_VERSION
         ):
-            warnings.warn(
+            messages.append(
                 "Capsule '%s' does not specify which taskwarrior versions it "
                 "is compatible with; you may encounter compatibility "
                 "problems. " % (
-                    self.command_name
+                    self.capsule_name
                 )
             )
         else:
@@ -68,18 +88,84 @@ class TaskwarriorCapsuleBase(object):
             max_tw_version = NormalizedVersion(self.MAX_TASKWARRIOR_VERSION)
 
             if not min_tw_version <= tw_version <= max_tw_version:
-                warnings.warn(
+                messages.append(
                     "Capsule '%s' is not compatible with version %s of "
                     "taskwarrior; "
                     "minimum version: %s; "
                     "maximum version %s." % (
-                        self.command_name,
+                        self.capsule_name,
                         tw_version,
                         min_tw_version,
                         max_tw_version,
                     ),
                 )
 
+        return messages
+
+    def get_compatibility_cache_key(self, variant=None, **kwargs):
+        """ Returns a key identifying this capsule's compatibility verdict.
+
+        The verdict only changes when the capsule class, the version of
+        the package providing it, taskwarrior-capsules itself, or the
+        installed taskwarrior version change.
+
+        """
+        package_version = ''
+        entry = self.meta.registry.get_entry(variant, self.capsule_name)
+        if entry is not None:
+            package_version = entry.get('version') or ''
+
+        taskwarrior_version = ''
+        if (
+            self.TASKWARRIOR_VERSION_CHECK_NECESSARY
+            and self.MIN_TASKWARRIOR_VERSION
+            and self.MAX_TASKWARRIOR_VERSION
+        ):
+            taskwarrior_version = get_taskwarrior_version_string(self.meta)
+
+        return '|'.join(
+            str(part) for part in (
+                '%s.%s' % (
+                    self.__class__.__module__,
+                    self.__class__.__name__,
+                ),
+                package_version,
+                __version__,
+                taskwarrior_version,
+                self.capsule_name,
+                self.MIN_VERSION,
+                self.MAX_VERSION,
+                self.TASKWARRIOR_VERSION_CHECK_NECESSARY,
+                self.MIN_TASKWARRIOR_VERSION,
+                self.MAX_TASKWARRIOR_VERSION,
+            )
+        )
+
+    def validate(self, **kwargs):
+        """ Warns if this capsule may be incompatible with its environment.
+
+        Verdicts are cached both in-process and in the metadata folder,
+        so the checks themselves (and the ``task --version`` probe they
+        may require) only run when the capsule or its environment
+        changes; cached warnings are re-emitted as-is.
+
+        """
+        key = self.get_compatibility_cache_key(**kwargs)
+        messages = self._compatibility_cache.get(key)
+
+        if messages is None:
+            cache = self.meta.get_cache('compatibility')
+            verdicts = cache.load()
+            messages = verdicts.get(key)
+            if not isinstance(messages, list):
+                messages = self.get_compatibility_warnings()
+                verdicts[key] = messages
+                cache.save(verdicts)
+            self._compatibility_cache[key] = messages
+
+        for message in messages:
+            warnings.warn(message)
+
         return True
 
 
@@ -91,6 +177,37 @@ class CommandCapsule(TaskwarriorCapsuleBase):
     MIN_TASKWARRIOR_VERSION = None
     MAX_TASKWARRIOR_VERSION = None
 
+    # Postprocessors setting this may run concurrently with other
+    # postprocessors on a thread pool.
+    PARALLEL_SAFE = False
+
+    # Postprocessors setting this run in a detached process after ``tw``
+    # has exited; their output is written to ``background.log`` in the
+    # metadata folder.  Users may override this per-capsule in
+    # ``capsules.conf``.
+    RUN_IN_BACKGROUND = False
+
+    # Pre- and postprocessors may set this to a list of the command
+    # names they are interested in; they are then neither imported nor
+    # run for other commands.  ``None`` subscribes to every command;
+    # override ``handles_command`` to decide at run time (among the
+    # commands listed here, if any).
+    COMMANDS = None
+
+    # Capsules setting this to `'data'` have ``get_matching_tasks`` and
+    # ``get_tasks_changed_since`` read taskwarrior's data files directly
+    # (see ``taskwarrior_capsules.datafile``) when their filter allows it,
+    # rather than running ``task export``.  Users may override this
+    # per-capsule in ``capsules.conf``.
+    READ_BACKEND = 'export'
+
+    # Read-only command capsules setting this have the output (written
+    # to ``sys.stdout``) and return value of ``handle`` cached, and
+    # replayed while their arguments and taskwarrior's data files are
+    # unchanged (see ``get_result_cache_state``).  Users may override
+    # this per-capsule in ``capsules.conf``.
+    CACHE_RESULTS = False
+
     def __init__(self, meta, capsule_name, client, **kwargs):
         self.meta = meta
         self.capsule_name = capsule_name
@@ -102,6 +219,24 @@ class CommandCapsule(TaskwarriorCapsuleBase):
         doc = cls.__doc__ if cls.__doc__ else ''
         return doc.strip().split('\n')[0].strip()
 
+    @classmethod
+    def handles_command(cls, command_name):
+        """ Whether this pre- or postprocessor runs for ``command_name``. """
+        return cls.COMMANDS is None or command_name in cls.COMMANDS
+
+    @classmethod
+    def get_subscriptions(cls):
+        """ Returns the command names this capsule subscribes to.
+
+        Returns ``None`` if it may run for any command.  An overridden
+        ``handles_command`` is only consulted for the commands listed
+        in ``COMMANDS``.
+
+        """
+        if cls.COMMANDS is None:
+            return None
+        return sorted(cls.COMMANDS)
+
     @property
     def configuration_filename(self):
         return self.meta.get_metadata_path(
@@ -114,9 +249,46 @@ class CommandCapsule(TaskwarriorCapsuleBase):
 
     @property
     def configuration(self):
-        if not hasattr(self, '_config'):
-            self._config = ConfigObj(self.configuration_filename)
-        return self._config
+        return self.meta.load_config(self.configuration_filename)
+
+    def save_configuration(self):
+        """ Atomically writes ``configuration`` to disk. """
+        self.meta.save_config(self.configuration)
+
+    @property
+    def async_client(self):
+        """ An ``AsyncCapsuleClient`` wrapping ``self.client``. """
+        if not hasattr(self, '_async_client'):
+            from .aio import AsyncCapsuleClient, DEFAULT_CONCURRENCY
+            self._async_client = AsyncCapsuleClient(
+                self.client,
+                concurrency=self.meta.get_setting(
+                    'client', 'max_concurrency', DEFAULT_CONCURRENCY,
+                ),
+            )
+        return self._async_client
+
+    @contextlib.contextmanager
+    def batch(self, chunk_size=None):
+        """ Collects task changes and applies them in bulk.
+
+        Yields a ``TaskChangeBatch``; tasks passed to its ``add`` and
+        ``update`` methods are saved with a single ``task import`` per
+        ``chunk_size`` tasks (``[client] batch_size`` in
+        ``capsules.conf``) when the block exits without raising an
+        exception.  The outcome of each change is then available as
+        the batch's ``results``.
+
+        """
+        from .batch import TaskChangeBatch, DEFAULT_CHUNK_SIZE
+
+        if chunk_size is None:
+            chunk_size = self.meta.get_setting(
+                'client', 'batch_size', DEFAULT_CHUNK_SIZE,
+            )
+        batch = TaskChangeBatch(self.client, chunk_size=chunk_size)
+        yield batch
+        batch.apply()
 
     def get_description(self):
         try:
@@ -124,39 +296,275 @@ class CommandCapsule(TaskwarriorCapsuleBase):
         except AttributeError:
             raise None
 
-    def get_matching_tasks(self, filter_args):
+    def read_tasks(self, filter_args):
+        """ Returns tasks matching ``filter_args`` read from data files.
+
+        Tasks are returned unmarshalled, in the shape ``export`` would
+        have produced.  Returns ``None`` unless this capsule uses the
+        ``'data'`` read backend and the filter can be evaluated without
+        taskwarrior.
+
+        """
+        backend = self.meta.get_setting(
+            ('capsules', self.capsule_name),
+            'read_backend',
+            self.READ_BACKEND,
+        )
+        if backend != 'data':
+            return None
+
+        from .datafile import TaskDataReader
+
+        return TaskDataReader(self.client).get_tasks(filter_args)
+
+    def export_tasks(self, *args):
+        """ Returns the unmarshalled results of ``task <args> export``. """
+        tasks = self.client._get_json(*(list(args) + ['export']))
+        if isinstance(tasks, dict):
+            tasks = [tasks]
+        return tasks
+
+    def build_tasks(self, tasks, compact=False):
+        """ Marshals exported ``tasks`` the way ``self.client`` would.
+
+        With ``compact``, returns a ``TaskBatch`` of lazily-marshalled
+        ``TaskRecord`` objects rather than a list of ``taskw`` tasks.
+
+        """
+        if compact:
+            from .records import TaskBatch
+            return TaskBatch(tasks, self.client)
+        return [self.client._get_task_object(task) for task in tasks]
+
+    def map_tasks(self, func, tasks, chunksize=None):
+        """ Returns ``[func(task) for task in tasks]``, using many processes.
+
+        ``func`` receives each task as the plain dictionary ``export``
+        would have produced, and must be picklable (e.g. defined at the
+        top level of a module).  Work is spread over ``max_workers``
+        processes (see the ``[map_tasks]`` section of ``capsules.conf``)
+        ``chunksize`` tasks at a time, unless there are fewer than
+        ``min_tasks`` tasks; results are returned in order.
+
+        """
+        from .index import to_export
+        from .pool import (
+            DEFAULT_MIN_TASKS, get_default_workers, map_payloads,
+        )
+
+        return map_payloads(
+            func,
+            [to_export(task) for task in tasks],
+            workers=self.meta.get_setting(
+                'map_tasks', 'max_workers', get_default_workers(),
+            ),
+            chunksize=chunksize,
+            min_tasks=self.meta.get_setting(
+                'map_tasks', 'min_tasks', DEFAULT_MIN_TASKS,
+            ),
+        )
+
+    def get_matching_tasks(self, filter_args, compact=False):
+        """ Returns a list of pending tasks matching ``filter_args``.
+
+        All tasks are built from a single ``export``; see
+        ``iter_matching_tasks`` for a variant streaming tasks as they
+        are read, and ``build_tasks`` for ``compact``.
+
+        """
+        filter_args = filter_args + ['status:pending']
+        tasks = self.read_tasks(filter_args)
+        if tasks is None:
+            tasks = self.export_tasks(*filter_args)
+        return self.build_tasks(tasks, compact=compact)
+
+    def get_task_index(self, filter_args=None):
+        """ Returns a ``TaskIndex`` of pending tasks matching ``filter_args``.
+
+        The index is built once and kept up-to-date as tasks are altered
+        through ``self.client``'s ``task_*`` methods; it is rebuilt if
+        task data may have changed in any other way.
+
+        """
+        from .datafile import parse_filter
+        from .index import TaskIndex
+
+        filter_args = list(filter_args or []) + ['status:pending']
+        key = tuple(filter_args)
+        if not hasattr(self, '_task_indexes'):
+            self._task_indexes = {}
+        index = self._task_indexes.get(key)
+        generation = self.client.snapshots.generation
+        if index is not None and index.generation == generation:
+            return index
+
+        predicates = parse_filter(filter_args)
+        predicate = None
+        if predicates is not None:
+            predicate = lambda task: all(
+                matches(task) for matches in predicates
+            )
+        index = TaskIndex(
+            self.get_matching_tasks(filter_args[:-1]),
+            predicate=predicate,
+        )
+        index.generation = generation
+        if predicate is not None:
+            # Otherwise, we can't tell whether an altered task still
+            # matches; the index is rebuilt after any change instead.
+            self.client.task_listeners.add(index)
+        self._task_indexes[key] = index
+        return index
+
+    def iter_matching_tasks(self, filter_args):
+        """ Yields pending tasks matching ``filter_args`` as they are read.
+
+        Use this rather than ``get_matching_tasks`` when a filter may
+        match very many tasks; memory use does not grow with the size
+        of the result.
+
+        """
+        from .export import iter_task_objects
+
         filter_command = filter_args + ['status:pending', 'export']
-        results = self.client._get_json(*filter_command)
+        return iter_task_objects(self.client, *filter_command)
+
+    def get_tasks_changed_since(self, since, compact=False):
+        """ Returns a list of tasks that were changed recently.
+
+        See ``build_tasks`` for ``compact``.
+
+        """
+        import pytz
+
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=pytz.utc)
+
+        # Taskwarrior's ``after`` is exclusive and only has one-second
+        # resolution, so ask for a little more than necessary and
+        # apply the exact bound below.
+        bound = (
+            since.astimezone(pytz.utc) - datetime.timedelta(seconds=1)
+        ).strftime(DATE_FORMAT)
+        filter_command = [
+            'status:pending',
+            '(',
+            'modified.after:%s' % bound,
+            'or',
+            '(',
+            'modified.none:',
+            'and',
+            'entry.after:%s' % bound,
+            ')',
+            ')',
+        ]
+
+        tasks = self.read_tasks(['status:pending'])
+        if tasks is None:
+            tasks = self.export_tasks(*filter_command)
 
-        tasks = []
-        for result in results:
-            _, task = self.client.get_task(
-                uuid=result['uuid']
+        # Exported dates sort chronologically, so compare them as-is
+        # rather than marshalling every task; they only have one-second
+        # resolution, so round ``since`` up to match.
+        if since.microsecond:
+            since = since.replace(microsecond=0) + datetime.timedelta(
+                seconds=1
             )
-            tasks.append(task)
+        since = since.astimezone(pytz.utc).strftime(DATE_FORMAT)
+        unknown = UNKNOWN_MODIFICATION_TIME.strftime(DATE_FORMAT)
+        changed_tasks = [
+            task for task in tasks
+            if task.get('modified', task.get('entry', unknown)) >= since
+        ]
 
+        return self.build_tasks(changed_tasks, compact=compact)
+
+    def get_high_water_mark(self):
+        """ Returns the time recorded by ``set_high_water_mark``, if any."""
+        high_water_mark = self.meta.get_cache(
+            'high_water_mark.%s' % self.capsule_name
+        ).load().get('time')
+        if not high_water_mark:
+            return None
+        return datetime.datetime.strptime(
+            high_water_mark,
+            DATE_FORMAT,
+        ).replace(tzinfo=datetime.timezone.utc)
+
+    def set_high_water_mark(self, when):
+        if when.tzinfo is None:
+            when = when.replace(tzinfo=datetime.timezone.utc)
+        self.meta.get_cache(
+            'high_water_mark.%s' % self.capsule_name
+        ).save({
+            'time': when.astimezone(datetime.timezone.utc).strftime(DATE_FORMAT),
+        })
+
+    def get_tasks_changed_since_last_run(self, commit=True):
+        """ Returns tasks changed since this capsule's last call to this.
+
+        The first call returns all pending tasks.  Unless ``commit`` is
+        ``False``, the current time is recorded as the capsule's new
+        high-water mark; if you'd rather only advance it once you've
+        finished processing the tasks, pass ``commit=False`` and call
+        ``set_high_water_mark`` yourself.
+
+        """
+        now = datetime.datetime.now(datetime.timezone.utc)
+        since = self.get_high_water_mark()
+        if since is None:
+            tasks = self.get_matching_tasks([])
+        else:
+            tasks = self.get_tasks_changed_since(since)
+        if commit:
+            self.set_high_water_mark(now)
         return tasks
 
-    def get_tasks_changed_since(self, since):
-        """ Returns a list of tasks that were changed recently."""
-        changed_tasks = []
+    def get_change_feed(self, replay_on_reset=True):
+        """ Returns a ``ChangeFeed`` following ``undo.data`` for this capsule.
 
-        for task in self.client.filter_tasks({'status': 'pending'}):
-            if task.get(
-                'modified',
-                task.get(
-                    'entry',
-                    datetime.datetime(2000, 1, 1).replace(tzinfo=pytz.utc)
-                )
-            ) >= since:
-                changed_tasks.append(task)
+        The feed's position is stored in the metadata folder; see
+        ``taskwarrior_capsules.changefeed``.
 
-        return changed_tasks
+        """
+        from .changefeed import ChangeFeed
+        from .datafile import TaskDataReader
+
+        reader = TaskDataReader(self.client)
+        date_fields, numeric_fields = reader.get_field_types()
+        return ChangeFeed(
+            os.path.join(reader.data_location, 'undo.data'),
+            self.meta.get_cache('change_feed.%s' % self.capsule_name),
+            replay_on_reset=replay_on_reset,
+            date_fields=date_fields,
+            numeric_fields=numeric_fields,
+        )
+
+    def get_changes_since_last_run(self, commit=True, replay_on_reset=True):
+        """ Returns the changes made to tasks since this was last called.
+
+        Each change is a ``Change`` holding the ``time`` it was made and
+        the task before (``old``, ``None`` for new tasks) and after
+        (``new``) it, as exported dictionaries.  The first call returns
+        every change recorded in ``undo.data``.  Unless ``commit`` is
+        ``False``, the feed's position is advanced past the returned
+        changes; to only advance it once you have processed them, call
+        ``read()`` and then ``commit()`` on ``get_change_feed()``
+        yourself.
+
+        """
+        feed = self.get_change_feed(replay_on_reset=replay_on_reset)
+        changes = feed.read()
+        if commit:
+            feed.commit()
+        return changes
 
     def execute(
         self, variant, command_name, filter_args, extra_args, **kwargs
     ):
-        self.validate(**kwargs)
+        profiler = get_profiler()
+        with profiler.phase('validate', capsule=self.capsule_name):
+            self.validate(variant=variant, **kwargs)
 
         command_name_map = {
             'preprocessor': 'preprocess',
@@ -165,15 +573,31 @@ class CommandCapsule(TaskwarriorCapsuleBase):
         }
 
         if hasattr(self, command_name_map.get(variant)):
-            return getattr(
-                self,
-                command_name_map[variant]
-            )(
-                filter_args,
-                extra_args,
-                command_name=command_name,
-                **kwargs
-            )
+            method = getattr(self, command_name_map[variant])
+
+            def run():
+                result = method(
+                    filter_args,
+                    extra_args,
+                    command_name=command_name,
+                    **kwargs
+                )
+                if isinstance(result, types.CoroutineType):
+                    import asyncio
+                    result = asyncio.run(result)
+                return result
+
+            with profiler.phase(
+                command_name_map[variant], capsule=self.capsule_name
+            ):
+                if variant == 'command' and self.caches_results():
+                    return self.result_cache.run(
+                        self.get_result_cache_key(
+                            command_name, filter_args, extra_args,
+                        ),
+                        run,
+                    )
+                return run()
 
         raise CapsuleProgrammingError(
             "%s was called as a %s but the %s method is not implemented!" % (
@@ -183,5 +607,53 @@ class CommandCapsule(TaskwarriorCapsuleBase):
             )
         )
 
+    def caches_results(self):
+        return self.meta.get_setting(
+            ('capsules', self.capsule_name),
+            'cache_results',
+            bool(self.CACHE_RESULTS),
+        )
+
+    @property
+    def result_cache(self):
+        from .resultcache import ResultCache, DEFAULT_MAX_BYTES
+        return ResultCache(
+            self.meta.get_metadata_path('cache', 'results'),
+            max_bytes=self.meta.get_setting(
+                'results', 'max_bytes', DEFAULT_MAX_BYTES,
+            ),
+        )
+
+    def get_result_cache_state(self):
+        """ Returns a value identifying the data ``handle``'s output uses.
+
+        By default, this is a fingerprint of taskwarrior's data files
+        and ``.taskrc``, found without setting up ``client``; override
+        this if your command's output depends upon something else.
+
+        """
+        from .resolver import get_taskrc_path
+        from .resultcache import get_data_fingerprint
+        from .taskwarrior import get_data_location
+
+        taskrc = get_taskrc_path()
+        return get_data_fingerprint(get_data_location(taskrc), taskrc)
+
+    def get_result_cache_key(self, command_name, filter_args, extra_args):
+        entry = self.meta.registry.get_entry('command', self.capsule_name)
+        isatty = getattr(sys.stdout, 'isatty', None)
+        return self.result_cache.get_key(
+            '%s.%s' % (self.__class__.__module__, self.__class__.__name__),
+            entry.get('version') if entry else None,
+            __version__,
+            self.capsule_name,
+            command_name,
+            list(filter_args),
+            list(extra_args),
+            bool(isatty and isatty()),
+            os.environ.get('TERM'),
+            self.get_result_cache_state(),
+        )
+
     def handle(self, filter_args, extra_args, **kwargs):
         raise NotImplementedError()
@@ -1,31 +1,98 @@
 import os
 
-from configobj import ConfigObj
+from .cache import ConfigCache, JSONCache
 
 
 class CapsuleMeta(object):
     def __init__(self):
-        try:
-            os.mkdir(self.metadata_folder)
-        except OSError:
-            pass
+        for folder in (self.metadata_folder, self.cache_folder):
+            try:
+                os.mkdir(folder)
+            except OSError:
+                pass
 
     @property
     def metadata_folder(self):
         return os.path.expanduser('~/.taskwarrior-capsules')
 
+    @property
+    def cache_folder(self):
+        return self.get_metadata_path('cache')
+
     def get_metadata_path(self, *args):
         return os.path.join(
             self.metadata_folder,
             *args
         )
 
+    def get_cache(self, name):
+        return JSONCache(
+            os.path.join(self.cache_folder, '%s.json' % name)
+        )
+
+    @property
+    def registry(self):
+        if not hasattr(self, '_registry'):
+            from .registry import CapsuleRegistry
+            self._registry = CapsuleRegistry(self)
+        return self._registry
+
+    def get_setting(self, section, name, default=None):
+        """ Returns a setting from ``capsules.conf``.
+
+        ``section`` may be a tuple naming a nested section, e.g.
+        ``('capsules', 'sync')`` for the ``[[sync]]`` subsection of
+        ``[capsules]``.  Values are converted to the type of ``default``
+        when it is a boolean or an integer; settings that are missing or
+        cannot be converted return ``default``.
+
+        """
+        if isinstance(section, str):
+            section = (section, )
+        if not os.path.exists(self.get_metadata_path('capsules.conf')):
+            # Spare ourselves importing configobj just to find nothing.
+            return default
+        try:
+            value = self.configuration
+            for part in section:
+                value = value[part]
+            value = value[name]
+        except (KeyError, TypeError):
+            return default
+
+        if isinstance(default, bool):
+            if isinstance(value, str):
+                value = value.strip().lower()
+                if value in ('1', 'true', 'yes', 'on', ):
+                    return True
+                if value in ('0', 'false', 'no', 'off', ):
+                    return False
+                return default
+            return bool(value)
+        elif isinstance(default, int):
+            try:
+                return int(value)
+            except (TypeError, ValueError):
+                return default
+        return value
+
+    @property
+    def config_cache(self):
+        return ConfigCache(self.cache_folder)
+
+    def load_config(self, path):
+        """ Returns a (shared) ``ConfigObj`` for the file at ``path``.
+
+        The file is only parsed again once it has changed; use this
+        rather than instantiating ``ConfigObj`` yourself.
+
+        """
+        return self.config_cache.load(path)
+
+    def save_config(self, config):
+        """ Atomically writes ``config`` (a ``ConfigObj``) to its file. """
+        self.config_cache.save(config)
+
     @property
     def configuration(self):
-        if not hasattr(self, '_config'):
-            self._config = ConfigObj(
-                self.get_metadata_path(
-                    'capsules.conf'
-                )
-            )
-        return self._config
+        return self.load_config(self.get_metadata_path('capsules.conf'))
@@ -0,0 +1,160 @@
+""" Following taskwarrior's ``undo.data`` to find what changed.
+
+Taskwarrior appends a transaction to ``undo.data`` for every change it
+makes to a task::
+
+    time 1600000000
+    old [description:"Before" ...]
+    new [description:"After" ...]
+    ---
+
+(``old`` is missing for tasks that were added.)  ``ChangeFeed`` reads
+the transactions appended since a stored byte offset, so the work a
+consumer does grows with the number of changes rather than with the
+number of tasks.
+
+Along with the offset, a digest of the bytes preceding it is stored;
+if ``undo.data`` has since been truncated or rewritten (e.g. by
+``task undo``) the digest no longer matches, and the feed starts over
+from the beginning of the file (or, if ``replay_on_reset`` is
+``False``, from its end).
+
+"""
+import collections
+import datetime
+import hashlib
+import os
+
+from taskw.utils import decode_task
+
+from .data import DATE_FORMAT
+from .datafile import DATE_FIELDS, to_export
+
+
+MARKER_SIZE = 256
+
+
+Change = collections.namedtuple('Change', ['time', 'old', 'new', ])
+Change.__doc__ = """ A single change recorded in ``undo.data``.
+
+``time`` is a timezone-aware datetime, and ``old`` and ``new`` the task
+before and after the change, as ``export`` would have produced them;
+``old`` is ``None`` for tasks that were added.
+
+"""
+
+
+def read_marker(in_, offset):
+    """ Returns a digest of the bytes of ``in_`` preceding ``offset``. """
+    start = max(0, offset - MARKER_SIZE)
+    in_.seek(start)
+    return hashlib.sha1(in_.read(offset - start)).hexdigest()
+
+
+def parse_transaction(lines, date_fields=DATE_FIELDS, numeric_fields=()):
+    """ Returns the ``Change`` recorded by ``lines``, or ``None``. """
+    when = None
+    tasks = {}
+    for line in lines:
+        kind, _, value = line.partition(' ')
+        if kind == 'time':
+            try:
+                when = datetime.datetime.fromtimestamp(
+                    int(value), datetime.timezone.utc
+                )
+            except (ValueError, OverflowError):
+                return None
+        elif kind in ('old', 'new', ) and value.startswith('['):
+            tasks[kind] = to_export(
+                decode_task(value), date_fields, numeric_fields,
+            )
+    if 'new' not in tasks:
+        return None
+    return Change(when, tasks.get('old'), tasks['new'])
+
+
+class ChangeFeed(object):
+    """ The changes appended to ``path`` since the position in ``cache``.
+
+    ``cache`` is a ``JSONCache`` storing the feed's position; call
+    ``commit`` once the changes returned by ``read`` are processed.
+
+    """
+    def __init__(
+        self, path, cache, replay_on_reset=True,
+        date_fields=DATE_FIELDS, numeric_fields=(),
+    ):
+        self.path = path
+        self.cache = cache
+        self.replay_on_reset = replay_on_reset
+        self.date_fields = date_fields
+        self.numeric_fields = numeric_fields
+        self.position = None
+
+    def get_start(self, in_, size):
+        """ Returns the offset reading should resume from. """
+        stored = self.cache.load()
+        offset = stored.get('offset')
+        if (
+            stored.get('path') == self.path
+            and isinstance(offset, int)
+            and 0 <= offset <= size
+            and read_marker(in_, offset) == stored.get('marker')
+        ):
+            return offset
+        if stored and not self.replay_on_reset:
+            return size
+        return 0
+
+    def read(self):
+        """ Returns the list of ``Change`` objects not yet committed. """
+        try:
+            in_ = open(self.path, 'rb')
+        except (IOError, OSError):
+            self.position = None
+            return []
+
+        with in_:
+            size = os.fstat(in_.fileno()).st_size
+            start = self.get_start(in_, size)
+            in_.seek(start)
+
+            changes = []
+            lines = []
+            offset = position = start
+            for line in in_:
+                if not line.endswith(b'\n'):
+                    # A transaction is still being written.
+                    break
+                offset += len(line)
+                line = line.decode('utf-8', 'replace').strip()
+                if line == '---':
+                    change = parse_transaction(
+                        lines, self.date_fields, self.numeric_fields,
+                    )
+                    if change is not None:
+                        changes.append(change)
+                    lines = []
+                    position = offset
+                elif line:
+                    lines.append(line)
+
+            self.position = (position, read_marker(in_, position), )
+        return changes
+
+    def __iter__(self):
+        return iter(self.read())
+
+    def commit(self):
+        """ Stores the position reached by the last ``read``. """
+        if self.position is None:
+            return
+        offset, marker = self.position
+        self.cache.save({
+            'path': self.path,
+            'offset': offset,
+            'marker': marker,
+            'time': datetime.datetime.now(
+                datetime.timezone.utc
+            ).strftime(DATE_FORMAT),
+        })
@@ -0,0 +1,101 @@
+from distutils.version import LooseVersion
+import json
+import weakref
+
+from taskw.warrior import TaskWarriorShellout
+
+from .snapshot import TaskSnapshotCache, args_may_mutate
+from .taskwarrior import get_taskwarrior_version_string
+
+
+# ``taskw`` methods returning the task they added or altered.
+TASK_CHANGING_METHODS = (
+    'task_add',
+    'task_annotate',
+    'task_delete',
+    'task_denotate',
+    'task_done',
+    'task_start',
+    'task_stop',
+    'task_update',
+)
+
+
+def notifies_listeners(name):
+    """ Wraps ``TaskWarriorShellout.<name>`` to notify task listeners. """
+    def method(self, *args, **kwargs):
+        before = self.snapshots.generation
+        result = getattr(
+            super(CapsuleClient, self), name
+        )(*args, **kwargs)
+        task = result
+        if isinstance(task, tuple) and len(task) == 2:
+            # ``(id, task)``
+            task = task[1]
+        if task and 'uuid' in task:
+            self.notify_tasks_changed([task], before)
+        return result
+    method.__name__ = name
+    return method
+
+
+class CapsuleClient(TaskWarriorShellout):
+    """ The taskwarrior client handed to capsules.
+
+    Behaves exactly like ``taskw``'s ``TaskWarriorShellout``, but:
+
+    * answers taskw's frequent version checks from the cached
+      ``task --version`` probe rather than executing ``task`` each time.
+    * shares ``export`` results between every capsule using this client
+      (see ``TaskSnapshotCache``) until a command that may alter task
+      data is executed.
+    * tells registered listeners (e.g. ``TaskIndex`` objects) about
+      each task it adds or alters through its ``task_*`` methods.
+
+    """
+    def __init__(self, *args, **kwargs):
+        super(CapsuleClient, self).__init__(*args, **kwargs)
+        self.snapshots = TaskSnapshotCache()
+        self.task_listeners = weakref.WeakSet()
+
+    def notify_tasks_changed(self, tasks, before):
+        """ Tells listeners about ``tasks`` altered since ``before``.
+
+        ``before`` is the snapshot generation preceding the changes.
+
+        """
+        after = self.snapshots.generation
+        for listener in list(self.task_listeners):
+            listener.tasks_changed(tasks, before, after)
+
+    @property
+    def marshal(self):
+        """ Whether tasks are returned as ``taskw`` ``Task`` objects. """
+        return self._marshal
+
+    @classmethod
+    def get_version(cls):
+        return LooseVersion(get_taskwarrior_version_string())
+
+    def _execute(self, *args):
+        try:
+            return super(CapsuleClient, self)._execute(*args)
+        finally:
+            if args_may_mutate(args):
+                self.snapshots.invalidate()
+
+    def _get_json(self, *args):
+        if not self.snapshots.is_cacheable(args):
+            return super(CapsuleClient, self)._get_json(*args)
+
+        snapshot = self.snapshots.get(args)
+        if snapshot is None:
+            generation = self.snapshots.generation
+            snapshot = self._execute(*args)[0]
+            self.snapshots.set(args, snapshot, generation=generation)
+        return json.loads(snapshot)
+
+
+for name in TASK_CHANGING_METHODS:
+    setattr(CapsuleClient, name, notifies_listeners(name))
+del name
@@ -1,36 +1,49 @@
-import pkg_resources
+import json
+import os
 import subprocess
 import sys
 
-from blessings import Terminal
-from taskw.warrior import TaskWarriorShellout
-
+from . import profiling
 from .exceptions import CapsuleError
-from .capsule import CommandCapsule
 from .capsule_meta import CapsuleMeta
-from .data import BUILT_IN_COMMANDS
+from .lazy import LazyObject, is_loaded
+from .profiling import get_profiler, profiling_requested
+from .registry import LazyCapsuleMapping
+from .resolver import (
+    CommandResolver,
+    get_taskwarrior_commands,
+    parse_obvious_args,
+)
+from .snapshot import command_may_mutate
 
 
-def get_installed_capsules(variant='command'):
-    groupmap = {
-        'command': 'taskwarrior_capsules',
-        'preprocessor': 'taskwarrior_preprocessor_capsules',
-        'postprocessor': 'taskwarrior_postprocessor_capsules',
-    }
+# blessings, taskw and concurrent.futures are imported on first use:
+# a plain passthrough to taskwarrior needs none of them.
 
-    possible_commands = {}
-    for entry_point in (
-        pkg_resources.iter_entry_points(group=groupmap[variant])
-    ):
-        try:
-            loaded_class = entry_point.load()
-        except ImportError:
-            continue
-        if not issubclass(loaded_class, CommandCapsule):
-            continue
-        possible_commands[entry_point.name] = loaded_class
+DEFAULT_POSTPROCESSOR_WORKERS = 4
+
+
+def get_terminal():
+    """ Returns a terminal that is only set up once it is used. """
+    def build():
+        from blessings import Terminal
+        return Terminal()
+    return LazyObject(build)
 
-    return possible_commands
+
+def get_client():
+    """ Returns a taskwarrior client that is only set up once used. """
+    def build():
+        with get_profiler().phase('client'):
+            from .client import CapsuleClient
+            return CapsuleClient(marshal=True)
+    return LazyObject(build)
+
+
+def get_installed_capsules(variant='command', meta=None):
+    if meta is None:
+        meta = CapsuleMeta()
+    return meta.registry.load_all(variant)
 
 
 def get_initialized_installed_capsules(
@@ -38,96 +51,403 @@ def get_initialized_installed_capsules(
     meta=None,
     client=None,
 ):
-    capsules = get_installed_capsules(variant)
-    for name, capsule in capsules.items():
-        capsules[name] = capsule(
-            meta,
-            name,
-            client,
+    if meta is None:
+        meta = CapsuleMeta()
+    return LazyCapsuleMapping(variant, meta, client)
+
+
+def report_capsule_error(term, capsule_name, exception):
+    if isinstance(exception, CapsuleError):
+        print(f'{term.red}The {capsule_name} taskwarrior capsule encountered an error processing your request: '
+              f'{term.normal}{term.red}{term.bold}{str(exception)}{term.normal}')
+    else:
+        print(f'{term.red}The {capsule_name} taskwarrior capsule failed unexpectedly: '
+              f'{term.normal}{term.red}{term.bold}{exception!r}{term.normal}')
+        import traceback
+        traceback.print_exception(
+            type(exception), exception, exception.__traceback__,
         )
-    return capsules
 
 
-def main(args=None):
-    if args is None:
-        args = sys.argv[1:]
+def run_in_background(meta, processor_name, postprocessors):
+    """ Whether postprocessor ``processor_name`` should run in the background.
 
-    term = Terminal()
-    meta = CapsuleMeta()
-    client = TaskWarriorShellout(marshal=True)
+    The ``background`` setting in the capsule's ``capsules.conf``
+    section wins; otherwise the capsule's ``RUN_IN_BACKGROUND``
+    attribute, as recorded in the registry, is used.
 
-    commands = get_initialized_installed_capsules(
-        'command',
-        meta,
-        client,
-    )
-    preprocessors = get_initialized_installed_capsules(
-        'preprocessor',
-        meta,
-        client,
-    )
-    postprocessors = get_initialized_installed_capsules(
-        'postprocessor',
-        meta,
-        client,
+    """
+    if hasattr(postprocessors, 'runs_in_background'):
+        default = postprocessors.runs_in_background(processor_name)
+    else:
+        default = bool(getattr(
+            postprocessors.get(processor_name), 'RUN_IN_BACKGROUND', False
+        ))
+    return meta.get_setting(
+        ('capsules', processor_name), 'background', default,
     )
 
-    command_name = ''
-    filter_args = []
-    extra_args = []
-    for idx, arg in enumerate(args):
-        if arg in commands or arg in BUILT_IN_COMMANDS:
-            command_name = arg
-            filter_args = args[0:idx]
-            extra_args = args[idx+1:]
-    if not command_name:
-        extra_args = args[0:]
-
-    for processor_name, processor in preprocessors.items():
-        filter_args, extra_args, command_name = processor.execute(
-            variant='preprocessor',
-            capsule_name=processor_name,
-            meta=meta,
-            command_name=command_name,
-            filter_args=filter_args,
-            extra_args=extra_args,
-            terminal=term,
+
+def spawn_background_postprocessors(processor_names, meta, **kwargs):
+    """ Runs postprocessors in a detached worker process.
+
+    The worker (see ``taskwarrior_capsules.background``) receives the
+    pipeline state as JSON on its standard input and appends its
+    output to ``background.log`` in the metadata folder; values that
+    cannot be represented in JSON (e.g. a capsule's custom result) are
+    passed as strings.  The worker is started from the metadata folder
+    so that the directory ``tw`` was run from is never on its
+    ``sys.path``.
+
+    """
+    payload = json.dumps({
+        'capsules': processor_names,
+        'command_name': kwargs['command_name'],
+        'filter_args': kwargs['filter_args'],
+        'extra_args': kwargs['extra_args'],
+        'result': kwargs['result'],
+    }, default=str).encode('utf-8')
+
+    with open(meta.get_metadata_path('background.log'), 'ab') as log:
+        worker = subprocess.Popen(
+            [sys.executable, '-m', 'taskwarrior_capsules.background'],
+            stdin=subprocess.PIPE,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+            cwd=meta.metadata_folder,
+            close_fds=True,
+            start_new_session=True,
         )
+    worker.stdin.write(payload)
+    worker.stdin.close()
+    return worker
+
 
-    if command_name in commands:
-        command = commands[command_name]
+def run_postprocessors(postprocessors, allow_background=True, **kwargs):
+    """ Runs every postprocessor, returning a list of (name, exception).
+
+    Postprocessors declaring themselves ``PARALLEL_SAFE`` run on a
+    thread pool (sized by the ``max_workers`` setting in the
+    ``[postprocessors]`` section of ``capsules.conf``) while the
+    remaining ones run, in order, on the calling thread.  Unless
+    ``allow_background`` is ``False``, postprocessors configured to
+    run in the background are handed to a detached worker process
+    instead.  Postprocessors not subscribing to the command are
+    skipped, and a failing postprocessor does not prevent the others
+    from running.
+
+    """
+    def run(processor_name, processor):
         try:
-            result = command.execute(
-                variant='command',
-                capsule_name=command_name,
-                meta=meta,
-                command_name=command_name,
-                filter_args=filter_args,
-                extra_args=extra_args,
-                terminal=term,
+            processor.execute(
+                variant='postprocessor',
+                capsule_name=processor_name,
+                **kwargs
             )
-        except CapsuleError as e:
-            print(f'{term.red}The {command_name} taskwarrior capsule encountered an error processing your request: '
-                  f'{term.normal}{term.red}{term.bold}{str(e)}{term.normal}')
-            sys.exit(90)
+        except Exception as e:
+            return e
+        return None
+
+    meta = kwargs['meta']
+    command_name = kwargs['command_name']
+    serial = []
+    parallel = []
+    background = []
+    if hasattr(postprocessors, 'subscribers'):
+        subscribers = set(postprocessors.subscribers(command_name))
     else:
-        # Run this as a normal command
+        subscribers = set(postprocessors)
+    for processor_name in postprocessors:
+        if allow_background and run_in_background(
+            meta, processor_name, postprocessors
+        ):
+            # Decided without instantiating the capsule; the worker
+            # checks whether it actually handles the command.
+            if processor_name in subscribers:
+                background.append(processor_name)
+            continue
+        if hasattr(postprocessors, 'get_subscriber'):
+            processor = postprocessors.get_subscriber(
+                processor_name, command_name,
+            )
+        else:
+            processor = postprocessors.get(processor_name)
+            if processor is not None and not processor.handles_command(
+                command_name
+            ):
+                processor = None
+        if processor is None:
+            continue
+        if processor.PARALLEL_SAFE:
+            parallel.append((processor_name, processor, ))
+        else:
+            serial.append((processor_name, processor, ))
+
+    outcomes = []
+    if background:
+        try:
+            spawn_background_postprocessors(background, **kwargs)
+        except (OSError, TypeError, ValueError) as e:
+            outcomes.extend(
+                (processor_name, e) for processor_name in background
+            )
+
+    if len(parallel) < 2:
+        max_workers = 1
+    else:
+        max_workers = meta.get_setting(
+            'postprocessors', 'max_workers', DEFAULT_POSTPROCESSOR_WORKERS,
+        )
+    if max_workers < 2:
+        serial = serial + parallel
+        parallel = []
+
+    if not parallel:
+        for processor_name, processor in serial:
+            outcomes.append((processor_name, run(processor_name, processor)))
+    else:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(
+            max_workers=min(max_workers, len(parallel))
+        ) as executor:
+            futures = [
+                (
+                    processor_name,
+                    executor.submit(run, processor_name, processor),
+                )
+                for processor_name, processor in parallel
+            ]
+            for processor_name, processor in serial:
+                outcomes.append(
+                    (processor_name, run(processor_name, processor))
+                )
+            for processor_name, future in futures:
+                outcomes.append((processor_name, future.result()))
+
+    return [
+        (processor_name, exception)
+        for processor_name, exception in outcomes
+        if exception is not None
+    ]
+
+
+class Pipeline(object):
+    """ Runs ``tw`` command lines through the capsule pipeline.
+
+    A pipeline holds the capsule registry, the (lazily instantiated)
+    installed capsules and the taskwarrior client, all of which can be
+    reused to run any number of command lines in a single process.
+
+    """
+    def __init__(self, meta=None, client=None):
+        self.meta = meta if meta is not None else CapsuleMeta()
+        if client is None:
+            client = get_client()
+        self.client = client
+
+        self.commands = get_initialized_installed_capsules(
+            'command',
+            self.meta,
+            self.client,
+        )
+        self.preprocessors = get_initialized_installed_capsules(
+            'preprocessor',
+            self.meta,
+            self.client,
+        )
+        self.postprocessors = get_initialized_installed_capsules(
+            'postprocessor',
+            self.meta,
+            self.client,
+        )
+
+    def preload(self):
+        """ Imports and instantiates every installed capsule up-front. """
+        for capsules in (
+            self.commands, self.preprocessors, self.postprocessors,
+        ):
+            for name in capsules:
+                capsules.get(name)
+        self.meta.configuration
+        self.client.snapshots
+
+    @property
+    def resolver(self):
+        """ A ``CommandResolver``, rebuilt once taskwarrior's commands change. """
+        taskwarrior = get_taskwarrior_commands(self.meta)
+        resolver = getattr(self, '_resolver', None)
+        if resolver is None or resolver.taskwarrior is not taskwarrior:
+            resolver = CommandResolver(taskwarrior, list(self.commands))
+            self._resolver = resolver
+        return resolver
+
+    def parse_args(self, args):
+        if get_taskwarrior_commands(self.meta, probe=False) is None:
+            # Spare ourselves running ``task`` when we can.
+            parsed = parse_obvious_args(args, self.commands)
+            if parsed is not None:
+                return parsed
+        return self.resolver.parse_args(args)
+
+    def get_task_args(self, command_name, filter_args, extra_args):
         task_args = ['task'] + filter_args
         if command_name:
             task_args.append(command_name)
-        task_args = task_args + extra_args
-        result = subprocess.call(task_args)
-
-    for processor_name, processor in postprocessors.items():
-        processor.execute(
-            variant='postprocessor',
-            capsule_name=processor_name,
-            meta=meta,
-            command_name=command_name,
-            filter_args=filter_args,
-            extra_args=extra_args,
-            terminal=term,
-            result=result
+        return task_args + extra_args
+
+    def can_exec(self, command_name):
+        """ Whether ``command_name`` can be handed straight to ``task``.
+
+        That is the case when it is not a capsule command and no pre- or
+        postprocessor subscribes to it; this is decided from the registry
+        alone, without importing any capsule.
+
+        """
+        return (
+            os.name == 'posix'
+            and command_name not in self.commands
+            and not self.preprocessors.subscribers(command_name)
+            and not self.postprocessors.subscribers(command_name)
         )
 
-    sys.exit(result)
+    def exec_task(self, task_args):
+        """ Replaces this process with ``task``; returns on failure. """
+        sys.stdout.flush()
+        sys.stderr.flush()
+        try:
+            os.execvp(task_args[0], task_args)
+        except OSError:
+            pass
+
+    def run(self, args, term=None, allow_exec=False):
+        """ Runs a single command line, returning its result.
+
+        If ``allow_exec`` is set and no capsule has anything to do with
+        the command line, this process is replaced by ``task`` and the
+        method never returns.
+
+        """
+        if allow_exec:
+            command_name, filter_args, extra_args = self.parse_args(args)
+            if self.can_exec(command_name):
+                self.exec_task(
+                    self.get_task_args(command_name, filter_args, extra_args)
+                )
+
+        if term is None:
+            term = get_terminal()
+        meta = self.meta
+        client = self.client
+
+        # Task data may have changed since a previous command line.
+        if is_loaded(client):
+            client.snapshots.invalidate()
+
+        profiler = get_profiler()
+
+        command_name, filter_args, extra_args = self.parse_args(args)
+
+        with profiler.phase('preprocessors'):
+            for processor_name in self.preprocessors:
+                # Earlier preprocessors may have changed the command.
+                processor = self.preprocessors.get_subscriber(
+                    processor_name, command_name,
+                )
+                if processor is None:
+                    continue
+                filter_args, extra_args, command_name = processor.execute(
+                    variant='preprocessor',
+                    capsule_name=processor_name,
+                    meta=meta,
+                    command_name=command_name,
+                    filter_args=filter_args,
+                    extra_args=extra_args,
+                    terminal=term,
+                )
+
+        command = self.commands.get(command_name)
+        if command is not None:
+            try:
+                result = command.execute(
+                    variant='command',
+                    capsule_name=command_name,
+                    meta=meta,
+                    command_name=command_name,
+                    filter_args=filter_args,
+                    extra_args=extra_args,
+                    terminal=term,
+                )
+            except CapsuleError as e:
+                report_capsule_error(term, command_name, e)
+                return 90
+        else:
+            # Run this as a normal command
+            task_args = self.get_task_args(
+                command_name, filter_args, extra_args,
+            )
+            with profiler.phase('passthrough'):
+                result = subprocess.call(task_args)
+
+        if command_may_mutate(command_name) and is_loaded(client):
+            client.snapshots.invalidate()
+
+        with profiler.phase('postprocessors'):
+            errors = run_postprocessors(
+                self.postprocessors,
+                meta=meta,
+                command_name=command_name,
+                filter_args=filter_args,
+                extra_args=extra_args,
+                terminal=term,
+                result=result,
+            )
+        for processor_name, exception in errors:
+            report_capsule_error(term, processor_name, exception)
+
+        return result
+
+
+def run_command_line(args, pipeline=None, allow_exec=False):
+    """ Runs a command line, profiling it if requested.
+
+    Returns the command's result; a new ``Pipeline`` is built unless
+    one is passed in.  ``allow_exec`` lets the pipeline replace this
+    process with ``task`` (see ``Pipeline.run``); it is ignored while
+    profiling.
+
+    """
+    profile, args = profiling_requested(args)
+    if not profile:
+        if pipeline is None:
+            pipeline = Pipeline()
+        return pipeline.run(args, allow_exec=allow_exec)
+
+    profiler = profiling.activate(profiling.Profiler())
+    try:
+        with profiler.phase('total'):
+            if pipeline is None:
+                pipeline = Pipeline()
+            result = pipeline.run(args)
+    finally:
+        profiling.deactivate()
+
+    profiler.report()
+    log_path = os.environ.get(profiling.PROFILE_LOG_ENVIRONMENT_VARIABLE)
+    if log_path:
+        profiler.write_log(log_path, args)
+    return result
+
+
+def main(args=None):
+    if args is None:
+        args = sys.argv[1:]
+
+    if args and args[0] == '--daemon':
+        from .daemon import serve
+        sys.exit(serve())
+
+    if args and args[0] == '--batch':
+        from .script import run_batch
+        sys.exit(run_batch(args[1:]))
+
+    sys.exit(run_command_line(args, allow_exec=True))
@@ -10,6 +10,13 @@ class Capsules(CommandCapsule):
     MIN_VERSION = __version__
     MAX_VERSION = __version__
 
+    # ``tw capsules list`` only changes when capsules are installed or
+    # removed; see ``get_result_cache_state``.
+    CACHE_RESULTS = True
+
+    def get_result_cache_state(self):
+        return self.meta.registry.fingerprint
+
     def handle(self, filter_args, extra_args, terminal=None, **kwargs):
         try:
             first_arg = extra_args[0].lower()
@@ -26,7 +33,7 @@ class Capsules(CommandCapsule):
             for headline, variant in search_list.items():
                 print(f'{terminal.bold}{terminal.blue}{headline}{terminal.normal}:')
 
-                for name, module in get_installed_capsules(variant).items():
+                for name, module in get_installed_capsules(variant, self.meta).items():
                     summary = module.get_summary()
                     print(f'- {terminal.bold}{name}{terminal.normal}: {summary if summary else "(No docstring)"}')
                 print("")
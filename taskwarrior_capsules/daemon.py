@@ -0,0 +1,333 @@
+""" A persistent ``tw`` server and the thin client forwarding to it.
+
+Starting ``tw`` requires importing taskw and friends, finding installed
+capsules and probing taskwarrior's version before any work can be done.
+``tw --daemon`` pays that cost once: it keeps a warm ``Pipeline``
+around and listens on a Unix socket in the metadata folder.  For each
+request it forks a child that adopts the client's standard streams
+(passed over the socket), working directory and environment, runs the
+command line, and reports its exit code back.
+
+The daemon rebuilds its pipeline whenever installed capsules change or
+the request's ``.taskrc`` differs from the one the pipeline was built
+for.  ``tw --batch`` command lines are run by the daemon too, against
+its warm pipeline.
+
+``tw-client`` (``client_main``) forwards its own command line to the
+daemon, and runs it in-process when no daemon is listening (or its
+standard streams cannot be passed on); this module deliberately imports
+nothing heavy at module level so that the client starts quickly.
+
+"""
+import array
+import json
+import os
+import signal
+import socket
+import struct
+import sys
+
+
+SOCKET_NAME = 'daemon.sock'
+HEADER = struct.Struct('!I')
+STREAM_FDS = (0, 1, 2, )
+# Seconds a client may take to send its request; requests are read one
+# at a time, so a stalled client would otherwise block every other.
+REQUEST_TIMEOUT = 5.0
+
+
+def get_socket_path(meta=None):
+    if meta is None:
+        from .capsule_meta import CapsuleMeta
+        meta = CapsuleMeta()
+    return meta.get_metadata_path(SOCKET_NAME)
+
+
+def get_taskrc_state(env):
+    """ Returns the ``.taskrc`` used under ``env``, and its signature. """
+    from .cache import get_file_signature
+
+    path = env.get('TASKRC')
+    if path is None:
+        path = os.path.join(env.get('HOME', '~'), '.taskrc')
+    path = os.path.expanduser(path)
+    return (path, get_file_signature(path), )
+
+
+def _read_message(connection, initial=b''):
+    data = initial
+    while len(data) < HEADER.size:
+        chunk = connection.recv(4096)
+        if not chunk:
+            return None, b''
+        data += chunk
+    length, = HEADER.unpack(data[:HEADER.size])
+    data = data[HEADER.size:]
+    while len(data) < length:
+        chunk = connection.recv(max(length - len(data), 4096))
+        if not chunk:
+            return None, b''
+        data += chunk
+    return json.loads(data[:length].decode('utf-8')), data[length:]
+
+
+def _write_message(connection, message):
+    body = json.dumps(message).encode('utf-8')
+    connection.sendall(HEADER.pack(len(body)) + body)
+
+
+def _receive_request(connection):
+    fd_size = array.array('i').itemsize
+    data, ancillary, _, _ = connection.recvmsg(
+        65536,
+        socket.CMSG_SPACE(len(STREAM_FDS) * fd_size),
+    )
+    fds = array.array('i')
+    for level, kind, cmsg_data in ancillary:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            usable = len(cmsg_data) - (len(cmsg_data) % fd_size)
+            fds.frombytes(cmsg_data[:usable])
+    request, _ = _read_message(connection, data)
+    return request, list(fds)
+
+
+def _run_request(run_command_line, pipeline, connection, request, fds):
+    """ Runs in the forked child; never returns. """
+    exit_code = 1
+    try:
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        # Become a process group the client can signal as a whole,
+        # including any ``task`` processes we start.  Unlike ``setsid``,
+        # this keeps the session's controlling terminal, which
+        # interactive commands open as ``/dev/tty``.
+        os.setpgid(0, 0)
+
+        for target, fd in zip(STREAM_FDS, fds):
+            os.dup2(fd, target)
+        for fd in fds:
+            if fd not in STREAM_FDS:
+                os.close(fd)
+        sys.stdin = open(0, 'r', closefd=False)
+        sys.stdout = open(1, 'w', closefd=False)
+        sys.stderr = open(2, 'w', closefd=False)
+
+        os.chdir(request['cwd'])
+        os.environ.clear()
+        os.environ.update(request['env'])
+
+        _write_message(connection, {'pid': os.getpid()})
+
+        argv = request['argv']
+        try:
+            if argv and argv[0] == '--batch':
+                from .script import run_batch
+                result = run_batch(argv[1:], pipeline)
+            else:
+                result = run_command_line(argv, pipeline)
+        except SystemExit as e:
+            result = e.code
+        except KeyboardInterrupt:
+            result = 130
+        if result is None:
+            exit_code = 0
+        elif isinstance(result, int):
+            exit_code = result
+        else:
+            print(result, file=sys.stderr)
+            exit_code = 1
+    except BaseException:
+        import traceback
+        traceback.print_exc()
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        except Exception:
+            pass
+        try:
+            _write_message(connection, {'exit': exit_code})
+        except Exception:
+            pass
+        os._exit(0)
+
+
+def _reap_children():
+    while True:
+        try:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            return
+        if pid == 0:
+            return
+
+
+def _is_listening(path):
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except (OSError, socket.error):
+        return False
+    finally:
+        probe.close()
+    return True
+
+
+def serve(meta=None):
+    """ Runs the ``tw`` daemon until interrupted. """
+    from .cmdline import Pipeline, run_command_line
+    from .registry import get_environment_fingerprint
+
+    pipeline = Pipeline(meta=meta)
+    pipeline.preload()
+    taskrc_state = get_taskrc_state(os.environ)
+    path = get_socket_path(pipeline.meta)
+
+    if _is_listening(path):
+        print("A tw daemon is already listening on %s." % path)
+        return 1
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    previous_umask = os.umask(0o077)
+    try:
+        server.bind(path)
+    finally:
+        os.umask(previous_umask)
+    server.listen(16)
+    server.settimeout(1.0)
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt()
+    signal.signal(signal.SIGTERM, stop)
+
+    print("tw daemon listening on %s" % path)
+    sys.stdout.flush()
+    try:
+        while True:
+            _reap_children()
+            try:
+                connection, _ = server.accept()
+            except socket.timeout:
+                continue
+            connection.settimeout(REQUEST_TIMEOUT)
+
+            fds = []
+            try:
+                request, fds = _receive_request(connection)
+                if request is None or len(fds) != len(STREAM_FDS):
+                    continue
+                connection.settimeout(None)
+
+                # Pick up capsules installed or removed, and taskwarrior
+                # configuration changed, since the pipeline was built.
+                state = get_taskrc_state(request['env'])
+                if get_environment_fingerprint() != (
+                    pipeline.meta.registry.fingerprint
+                ):
+                    pipeline.meta.registry.refresh()
+                    state = None
+                if state != taskrc_state:
+                    pipeline = Pipeline(meta=pipeline.meta)
+                    pipeline.preload()
+                    taskrc_state = get_taskrc_state(request['env'])
+
+                if os.fork() == 0:
+                    server.close()
+                    _run_request(
+                        run_command_line, pipeline, connection, request, fds,
+                    )
+            except (OSError, ValueError):
+                continue
+            finally:
+                for fd in fds:
+                    os.close(fd)
+                connection.close()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+    return 0
+
+
+def _run_locally(args):
+    from .cmdline import main
+    main(args)
+
+
+def client_main(args=None):
+    """ Forwards a ``tw`` command line to the daemon.
+
+    Falls back to running the command line in this process when no
+    daemon is listening, or when this process' standard streams cannot
+    be passed to it (e.g. because one of them is closed).
+
+    """
+    if args is None:
+        args = sys.argv[1:]
+    if args and args[0] == '--daemon':
+        return _run_locally(args)
+
+    path = get_socket_path()
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(path)
+    except (OSError, socket.error):
+        connection.close()
+        return _run_locally(args)
+
+    body = json.dumps({
+        'argv': args,
+        'env': dict(os.environ),
+        'cwd': os.getcwd(),
+    }).encode('utf-8')
+    message = HEADER.pack(len(body)) + body
+    sys.stdout.flush()
+    sys.stderr.flush()
+    try:
+        sent = connection.sendmsg(
+            [message],
+            [(
+                socket.SOL_SOCKET,
+                socket.SCM_RIGHTS,
+                array.array('i', STREAM_FDS),
+            )],
+        )
+        if sent < len(message):
+            connection.sendall(message[sent:])
+    except (OSError, socket.error):
+        connection.close()
+        return _run_locally(args)
+
+    child = {}
+
+    def relay(signum, frame):
+        if 'pid' in child:
+            try:
+                os.killpg(child['pid'], signum)
+            except OSError:
+                pass
+    for signum in (signal.SIGINT, signal.SIGTERM, signal.SIGHUP, ):
+        signal.signal(signum, relay)
+
+    pending = b''
+    while True:
+        try:
+            response, pending = _read_message(connection, pending)
+        except InterruptedError:
+            continue
+        if response is None:
+            # The daemon went away without reporting an exit code.
+            sys.exit(1)
+        if 'pid' in response:
+            child['pid'] = response['pid']
+        if 'exit' in response:
+            sys.exit(response['exit'])
@@ -1,3 +1,6 @@
+# The format taskwarrior uses for dates in its JSON export.
+DATE_FORMAT = '%Y%m%dT%H%M%SZ'
+
 BUILT_IN_COMMANDS = [
     'add',
     'annotate',
@@ -34,3 +37,47 @@ BUILT_IN_COMMANDS = [
     'uuids',
     'version',
 ]
+
+# Reports every taskwarrior installation defines.
+DEFAULT_REPORTS = [
+    'active',
+    'all',
+    'blocked',
+    'blocking',
+    'completed',
+    'list',
+    'long',
+    'ls',
+    'minimal',
+    'newest',
+    'next',
+    'oldest',
+    'overdue',
+    'ready',
+    'recurring',
+    'unblocked',
+    'waiting',
+]
+
+# Built-in commands (and aliases taskw uses) that may alter task data.
+MUTATING_COMMANDS = [
+    'add',
+    'annotate',
+    'append',
+    'config',
+    'delete',
+    'denotate',
+    'done',
+    'duplicate',
+    'edit',
+    'execute',
+    'import',
+    'log',
+    'modify',
+    'prepend',
+    'start',
+    'stop',
+    'sync',
+    'synchronize',
+    'undo',
+]
@@ -0,0 +1,334 @@
+""" Read-only access to taskwarrior's data files.
+
+Rather than running ``task export``, ``TaskDataReader`` reads
+``pending.data`` and ``completed.data`` directly and converts each task
+into the shape ``export`` would have produced.  Parsed files are kept
+in memory keyed on their size and modification time (and the types of
+the UDAs they were converted with), so repeated reads in a single
+process (or a ``tw`` daemon) cost next to nothing.
+
+Only simple filters -- ``status``, ``project``, ``uuid``, ``+tag`` and
+``-tag``, and ``.before``/``.after``/``.none``/``.any`` on date
+attributes -- are evaluated here; ``get_tasks`` returns ``None`` for
+anything else so callers can fall back to ``export``.  Values taskwarrior
+computes on export (e.g. ``urgency``) are not available.
+
+"""
+import calendar
+import datetime
+import mmap
+import os
+import threading
+
+from taskw.utils import decode_task
+
+from .data import DATE_FORMAT
+
+
+DATE_FIELDS = (
+    'due',
+    'end',
+    'entry',
+    'modified',
+    'scheduled',
+    'start',
+    'until',
+    'wait',
+)
+PENDING_STATUSES = ('pending', 'recurring', 'waiting', )
+ANNOTATION_PREFIX = 'annotation_'
+
+# Formats accepted for dates in filters; values not ending in ``Z`` are
+# taken to be local times, as taskwarrior does.
+FILTER_DATE_FORMATS = (
+    (DATE_FORMAT, True, ),
+    ('%Y-%m-%dT%H:%M:%S', False, ),
+    ('%Y-%m-%d', False, ),
+)
+
+# (size, mtime_ns, field types, tasks) for each data file read so far.
+_file_cache = {}
+_file_cache_lock = threading.Lock()
+
+
+def copy_task(task):
+    """ Returns a copy of ``task`` sharing nothing mutable with it. """
+    copied = {}
+    for key, value in task.items():
+        if isinstance(value, list):
+            value = [
+                dict(item) if isinstance(item, dict) else item
+                for item in value
+            ]
+        copied[key] = value
+    return copied
+
+
+def format_epoch(value):
+    try:
+        return datetime.datetime.utcfromtimestamp(
+            int(value)
+        ).strftime(DATE_FORMAT)
+    except (TypeError, ValueError, OverflowError):
+        return value
+
+
+def parse_filter_date(value):
+    """ Returns ``value`` in ``DATE_FORMAT`` (UTC), or ``None``. """
+    for date_format, is_utc in FILTER_DATE_FORMATS:
+        try:
+            parsed = datetime.datetime.strptime(value, date_format)
+        except ValueError:
+            continue
+        if is_utc:
+            epoch = calendar.timegm(parsed.timetuple())
+        else:
+            epoch = parsed.timestamp()
+        return format_epoch(epoch)
+    return None
+
+
+def to_export(record, date_fields=DATE_FIELDS, numeric_fields=()):
+    """ Converts a decoded data file record to ``export``'s shape. """
+    task = {}
+    annotations = []
+    for key, value in record.items():
+        if key.startswith(ANNOTATION_PREFIX):
+            annotations.append({
+                'entry': format_epoch(key[len(ANNOTATION_PREFIX):]),
+                'description': value,
+            })
+        elif key in date_fields:
+            task[key] = format_epoch(value)
+        elif key == 'depends':
+            task[key] = [uuid for uuid in value.split(',') if uuid]
+        elif key in numeric_fields:
+            try:
+                task[key] = float(value) if '.' in value else int(value)
+            except ValueError:
+                task[key] = value
+        else:
+            task[key] = value
+    if annotations:
+        task['annotations'] = sorted(
+            annotations, key=lambda annotation: annotation['entry']
+        )
+    return task
+
+
+def iter_records(path):
+    """ Yields the decoded records of a data file. """
+    with open(path, 'rb') as in_:
+        if os.fstat(in_.fileno()).st_size == 0:
+            return
+        data = mmap.mmap(in_.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            for line in iter(data.readline, b''):
+                line = line.strip()
+                if line.startswith(b'['):
+                    yield decode_task(line.decode('utf-8', 'replace'))
+        finally:
+            data.close()
+
+
+def parse_filter(filter_args):
+    """ Returns a list of predicates equivalent to ``filter_args``.
+
+    Returns ``None`` if any argument is not understood.
+
+    """
+    predicates = []
+    for arg in filter_args:
+        if not arg or ' ' in arg:
+            return None
+        if arg[0] in '+-' and len(arg) > 1:
+            tag = arg[1:]
+            if tag.isupper():
+                # A virtual tag (+OVERDUE, +PENDING, ...)
+                return None
+            if arg[0] == '+':
+                predicates.append(
+                    lambda task, tag=tag: tag in task.get('tags', ())
+                )
+            else:
+                predicates.append(
+                    lambda task, tag=tag: tag not in task.get('tags', ())
+                )
+            continue
+        if ':' not in arg:
+            return None
+
+        attribute, value = arg.split(':', 1)
+        if '.' in attribute:
+            attribute, modifier = attribute.split('.', 1)
+        else:
+            modifier = ''
+
+        if attribute == 'status' and modifier in ('', 'is', 'not', ):
+            if modifier == 'not':
+                predicates.append(
+                    lambda task, value=value: task.get('status') != value
+                )
+            else:
+                predicates.append(
+                    lambda task, value=value: task.get('status') == value
+                )
+        elif attribute == 'uuid' and not modifier:
+            predicates.append(
+                lambda task, value=value: task.get('uuid') == value
+            )
+        elif attribute == 'project' and modifier in ('', 'is', 'not', ):
+            if modifier == 'is' or not value:
+                predicates.append(
+                    lambda task, value=value: task.get('project', '') == value
+                )
+            elif modifier == 'not':
+                predicates.append(
+                    lambda task, value=value: not task.get(
+                        'project', ''
+                    ).startswith(value)
+                )
+            else:
+                predicates.append(
+                    lambda task, value=value: task.get(
+                        'project', ''
+                    ).startswith(value)
+                )
+        elif attribute in DATE_FIELDS and modifier in ('none', 'any', ):
+            if value:
+                return None
+            if modifier == 'none':
+                predicates.append(
+                    lambda task, field=attribute: field not in task
+                )
+            else:
+                predicates.append(
+                    lambda task, field=attribute: field in task
+                )
+        elif attribute in DATE_FIELDS and modifier in ('before', 'after', ):
+            bound = parse_filter_date(value)
+            if bound is None:
+                return None
+            # Dates in ``DATE_FORMAT`` sort chronologically.
+            if modifier == 'before':
+                predicates.append(
+                    lambda task, field=attribute, bound=bound: (
+                        field in task and task[field] < bound
+                    )
+                )
+            else:
+                predicates.append(
+                    lambda task, field=attribute, bound=bound: (
+                        field in task and task[field] > bound
+                    )
+                )
+        else:
+            return None
+    return predicates
+
+
+class TaskDataReader(object):
+    """ Reads tasks for ``client`` straight from its data files. """
+    def __init__(self, client):
+        self.client = client
+
+    @property
+    def data_location(self):
+        location = os.environ.get('TASKDATA')
+        if not location:
+            try:
+                location = self.client.config['data']['location']
+            except (KeyError, TypeError):
+                location = '~/.task'
+        return os.path.expanduser(location)
+
+    def is_available(self):
+        """ Whether tasks can be read without running ``task``.
+
+        Data files that do not exist, or an active context (which
+        taskwarrior would apply to the filter), rule out reading them
+        directly.
+
+        """
+        if self.client.config.get('context'):
+            return False
+        return os.path.exists(
+            os.path.join(self.data_location, 'pending.data')
+        )
+
+    def get_field_types(self):
+        date_fields = set(DATE_FIELDS)
+        numeric_fields = set()
+        for name, settings in self.client.config.get('uda', {}).items():
+            kind = settings.get('type', '') if hasattr(
+                settings, 'get'
+            ) else ''
+            if kind == 'date':
+                date_fields.add(name)
+            elif kind == 'numeric':
+                numeric_fields.add(name)
+        return frozenset(date_fields), frozenset(numeric_fields)
+
+    def read(self, filename):
+        """ Returns every task stored in ``filename``, in export shape.
+
+        The tasks returned are shared with later reads and must not be
+        modified; ``get_tasks`` returns copies.
+
+        """
+        path = os.path.join(self.data_location, filename)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return []
+
+        field_types = self.get_field_types()
+        key = (stat.st_size, stat.st_mtime_ns, field_types, )
+        with _file_cache_lock:
+            cached = _file_cache.get(path)
+        if cached and cached[:3] == key:
+            return cached[3]
+
+        date_fields, numeric_fields = field_types
+        tasks = []
+        next_id = 1
+        for record in iter_records(path):
+            task = to_export(record, date_fields, numeric_fields)
+            if filename == 'pending.data' and (
+                task.get('status') in PENDING_STATUSES
+            ):
+                task['id'] = next_id
+                next_id += 1
+            else:
+                task['id'] = 0
+            tasks.append(task)
+
+        with _file_cache_lock:
+            _file_cache[path] = key + (tasks, )
+        return tasks
+
+    def get_tasks(self, filter_args):
+        """ Returns tasks matching ``filter_args`` in export shape.
+
+        Returns ``None`` if the filter cannot be evaluated here.
+
+        """
+        predicates = parse_filter(filter_args)
+        if predicates is None or not self.is_available():
+            return None
+
+        statuses = set(
+            arg.split(':', 1)[1] for arg in filter_args
+            if arg.startswith('status:')
+        )
+        filenames = ['pending.data']
+        if not statuses or not statuses.issubset(PENDING_STATUSES):
+            filenames.append('completed.data')
+
+        matching = []
+        for filename in filenames:
+            for task in self.read(filename):
+                if all(predicate(task) for predicate in predicates):
+                    # Capsules may modify the tasks they're given.
+                    matching.append(copy_task(task))
+        return matching
@@ -0,0 +1,125 @@
+import codecs
+import json
+import os
+import subprocess
+
+import six
+from taskw.exceptions import TaskwarriorError
+import taskw.utils
+
+
+READ_SIZE = 64 * 1024
+
+
+def iter_json_array(stream, encoding='utf-8', read_size=READ_SIZE):
+    """ Yields the elements of a JSON array as they are read from ``stream``.
+
+    ``stream`` must be a binary file-like object; only the element
+    currently being decoded (plus at most one read's worth of data) is
+    held in memory at any time.
+
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder(encoding)('replace')
+    buffer = ''
+    position = 0
+    started = False
+    eof = False
+
+    while True:
+        # Skip whitespace and separators preceding the next element.
+        while position < len(buffer) and buffer[position] in ' \t\r\n,':
+            position += 1
+        if not started and position < len(buffer):
+            if buffer[position] != '[':
+                raise ValueError("Expected a JSON array.")
+            started = True
+            position += 1
+            continue
+        if started and position < len(buffer) and buffer[position] == ']':
+            return
+
+        if position < len(buffer):
+            try:
+                value, end = decoder.raw_decode(buffer, position)
+            except ValueError:
+                value, end = None, None
+            # Numbers are only known to be complete once followed by a
+            # delimiter; objects, arrays and strings are self-delimiting.
+            if end is not None and (
+                eof
+                or isinstance(value, (dict, list, six.string_types))
+                or (end < len(buffer) and buffer[end] in ' \t\r\n,]')
+            ):
+                yield value
+                position = end
+                continue
+            if eof:
+                raise ValueError("Truncated JSON array.")
+
+        if eof:
+            if not started:
+                return
+            raise ValueError("Truncated JSON array.")
+
+        chunk = stream.read(read_size)
+        if not chunk:
+            eof = True
+            buffer = buffer[position:] + text_decoder.decode(b'', final=True)
+        else:
+            buffer = buffer[position:] + text_decoder.decode(chunk)
+        position = 0
+
+
+def get_export_command(client, *args):
+    command = (
+        [
+            'task',
+        ]
+        + client.get_configuration_override_args()
+        + [six.text_type(arg) for arg in args]
+    )
+    # Match ``TaskWarriorShellout._execute``'s argument cleaning.
+    for i in range(len(command)):
+        if isinstance(command[i], six.text_type):
+            command[i] = (
+                taskw.utils.clean_ctrl_chars(command[i].encode('utf-8'))
+            )
+    return command
+
+
+def iter_task_objects(client, *args):
+    """ Executes a taskwarrior ``export`` and yields tasks as they arrive.
+
+    Tasks are marshalled exactly as ``client`` would marshal the
+    results of ``_get_task_objects``; the full export is never held
+    in memory.
+
+    """
+    command = get_export_command(client, *args)
+    env = os.environ.copy()
+    env['TASKRC'] = client.config_filename
+
+    proc = subprocess.Popen(
+        command,
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    try:
+        for obj in iter_json_array(
+            proc.stdout,
+            encoding=client.config.get('encoding', 'utf-8'),
+        ):
+            yield client._get_task_object(obj)
+        proc.stdout.close()
+        stderr = proc.stderr.read()
+    finally:
+        if proc.poll() is None and not proc.stdout.closed:
+            # The consumer stopped early; don't leave ``task`` blocked
+            # writing into a pipe nobody is reading.
+            proc.kill()
+        proc.wait()
+
+    if proc.returncode != 0:
+        raise TaskwarriorError(command, stderr, b'', proc.returncode)
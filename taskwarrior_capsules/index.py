@@ -0,0 +1,211 @@
+""" In-memory secondary indexes over a set of tasks.
+
+``TaskIndex`` answers lookups by uuid, project, tag and status in
+constant time and range queries over ``due``, ``modified`` and
+``entry`` in logarithmic time, rather than requiring a scan of every
+task (or another ``export``) per lookup.
+
+Indexes are keyed on the values ``export`` would have produced, so
+tasks may be ``taskw`` tasks, plain exported dictionaries or
+``TaskRecord`` objects; dates are compared in ``DATE_FORMAT``, which
+sorts chronologically.
+
+"""
+import bisect
+import datetime
+
+from .data import DATE_FORMAT
+
+
+HASHED_FIELDS = ('uuid', 'project', 'tags', 'status', )
+SORTED_FIELDS = ('due', 'modified', 'entry', )
+
+
+def export_annotations(annotations):
+    """ Returns ``annotations`` as ``export`` lists them.
+
+    ``taskw`` holds annotations as strings (remembering the entry date
+    of those it read), and serializes them as such; ``export`` -- and
+    ``import`` -- use an object per annotation instead.
+
+    """
+    exported = []
+    for annotation in annotations:
+        if isinstance(annotation, dict):
+            exported.append(dict(annotation))
+            continue
+        entry = getattr(annotation, 'entry', None)
+        if entry is None:
+            entry = datetime.datetime.now(datetime.timezone.utc)
+        exported.append({
+            'entry': to_sort_key(entry),
+            'description': str(annotation),
+        })
+    return exported
+
+
+def to_export(task):
+    """ Returns ``task`` as a dictionary in ``export``'s shape. """
+    if hasattr(task, 'to_dict'):
+        return task.to_dict()
+    exported = task
+    if hasattr(task, 'serialized'):
+        exported = task.serialized()
+    annotations = task.get('annotations')
+    if annotations and not all(
+        isinstance(annotation, dict) for annotation in annotations
+    ):
+        if exported is task:
+            exported = dict(task)
+        exported['annotations'] = export_annotations(annotations)
+    return exported
+
+
+def to_sort_key(value):
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(
+                datetime.timezone.utc
+            ).replace(tzinfo=None)
+        return value.strftime(DATE_FORMAT)
+    return value
+
+
+class TaskIndex(object):
+    """ Hash and sorted indexes over ``tasks``.
+
+    ``predicate``, if given, is called with each task (in ``export``
+    shape) passed to ``update``; tasks for which it returns ``False``
+    are removed from the index rather than updated.
+
+    """
+    def __init__(self, tasks=(), predicate=None):
+        self.predicate = predicate
+        self.generation = None
+        self.tasks = {}
+        self.hashed = dict((field, {}) for field in HASHED_FIELDS)
+        self.sorted = dict((field, []) for field in SORTED_FIELDS)
+        self._keys = {}
+        for task in tasks:
+            self.add(task)
+
+    def __len__(self):
+        return len(self.tasks)
+
+    def __iter__(self):
+        return iter(list(self.tasks.values()))
+
+    def __contains__(self, uuid):
+        return str(uuid) in self.tasks
+
+    def get_keys(self, exported):
+        keys = {}
+        for field in HASHED_FIELDS:
+            value = exported.get(field)
+            if field == 'tags':
+                keys[field] = tuple(set(value or ()))
+            elif value is not None:
+                keys[field] = (str(value), )
+            else:
+                keys[field] = ()
+        for field in SORTED_FIELDS:
+            if exported.get(field) is not None:
+                keys[field] = to_sort_key(exported[field])
+        return keys
+
+    def add(self, task):
+        """ Adds ``task``, replacing any task having the same uuid. """
+        exported = to_export(task)
+        uuid = str(exported['uuid'])
+        if uuid in self.tasks:
+            self.discard(uuid)
+
+        keys = self.get_keys(exported)
+        self.tasks[uuid] = task
+        self._keys[uuid] = keys
+        for field in HASHED_FIELDS:
+            for value in keys[field]:
+                self.hashed[field].setdefault(value, {})[uuid] = None
+        for field in SORTED_FIELDS:
+            if field in keys:
+                bisect.insort(self.sorted[field], (keys[field], uuid, ))
+
+    def discard(self, uuid):
+        """ Removes the task having ``uuid``, if present. """
+        uuid = str(uuid)
+        keys = self._keys.pop(uuid, None)
+        if keys is None:
+            return
+        del self.tasks[uuid]
+        for field in HASHED_FIELDS:
+            for value in keys[field]:
+                bucket = self.hashed[field][value]
+                del bucket[uuid]
+                if not bucket:
+                    del self.hashed[field][value]
+        for field in SORTED_FIELDS:
+            if field in keys:
+                entries = self.sorted[field]
+                del entries[bisect.bisect_left(entries, (keys[field], uuid, ))]
+
+    def update(self, task):
+        """ Reflects a change to ``task`` made since the index was built. """
+        exported = to_export(task)
+        if self.predicate is not None and not self.predicate(exported):
+            self.discard(exported['uuid'])
+        else:
+            self.add(task)
+
+    def tasks_changed(self, tasks, before, after):
+        """ Called by ``CapsuleClient`` whenever it alters ``tasks``.
+
+        The changes are only applied if the index reflected the task
+        data as it was before they were made (``before``); otherwise the
+        index is left stale for its owner to rebuild.
+
+        """
+        if self.generation != before:
+            return
+        for task in tasks:
+            self.update(task)
+        self.generation = after
+
+    def _lookup(self, field, value):
+        return [
+            self.tasks[uuid] for uuid in self.hashed[field].get(value, ())
+        ]
+
+    def get(self, uuid, default=None):
+        return self.tasks.get(str(uuid), default)
+
+    def by_project(self, project):
+        return self._lookup('project', project)
+
+    def by_tag(self, tag):
+        return self._lookup('tags', tag)
+
+    def by_status(self, status):
+        return self._lookup('status', status)
+
+    def projects(self):
+        return list(self.hashed['project'].keys())
+
+    def tags(self):
+        return list(self.hashed['tags'].keys())
+
+    def range(self, field, start=None, end=None):
+        """ Returns tasks whose ``field`` is in ``[start, end)``, in order.
+
+        ``field`` is one of ``due``, ``modified`` or ``entry``; ``start``
+        and ``end`` may be datetimes or dates in ``DATE_FORMAT``.  Tasks
+        without a value for ``field`` are never returned.
+
+        """
+        entries = self.sorted[field]
+        low = 0
+        high = len(entries)
+        if start is not None:
+            low = bisect.bisect_left(entries, (to_sort_key(start), ))
+        if end is not None:
+            high = bisect.bisect_left(entries, (to_sort_key(end), ))
+        return [self.tasks[uuid] for _, uuid in entries[low:high]]
@@ -0,0 +1,49 @@
+""" Deferred construction of expensive objects.
+
+``tw`` passes most command lines straight through to taskwarrior; for
+those, building a terminal or a taskw client (and importing the
+libraries behind them) is wasted work.  ``LazyObject`` stands in for
+such an object and builds it on first attribute access.
+
+"""
+
+
+class LazyObject(object):
+    """ Proxy building its target by calling ``factory`` on first use. """
+    __slots__ = ('_factory', '_wrapped', )
+
+    def __init__(self, factory):
+        object.__setattr__(self, '_factory', factory)
+        object.__setattr__(self, '_wrapped', None)
+
+    def _lazy_load(self):
+        wrapped = object.__getattribute__(self, '_wrapped')
+        if wrapped is None:
+            wrapped = object.__getattribute__(self, '_factory')()
+            object.__setattr__(self, '_wrapped', wrapped)
+        return wrapped
+
+    def __getattr__(self, name):
+        return getattr(self._lazy_load(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._lazy_load(), name, value)
+
+    def __delattr__(self, name):
+        delattr(self._lazy_load(), name)
+
+    def __call__(self, *args, **kwargs):
+        return self._lazy_load()(*args, **kwargs)
+
+    def __repr__(self):
+        wrapped = object.__getattribute__(self, '_wrapped')
+        if wrapped is None:
+            return '<LazyObject (not yet loaded)>'
+        return repr(wrapped)
+
+
+def is_loaded(obj):
+    """ Returns ``False`` for a ``LazyObject`` that was never used. """
+    if isinstance(obj, LazyObject):
+        return object.__getattribute__(obj, '_wrapped') is not None
+    return True
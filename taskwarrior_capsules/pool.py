@@ -0,0 +1,48 @@
+""" Spreading CPU-bound per-task work over several processes.
+
+``map_payloads`` applies a function to each of a list of task payloads
+on a process pool, returning the results in order.  Payloads are the
+plain dictionaries ``export`` produces (see ``index.to_export``) rather
+than ``taskw`` objects, keeping what is pickled and sent to each worker
+small; inputs smaller than ``min_tasks`` are processed in this process,
+where starting workers would cost more than it saves.
+
+"""
+import os
+
+
+DEFAULT_MIN_TASKS = 256
+
+
+def get_default_workers():
+    return os.cpu_count() or 1
+
+
+def get_chunksize(count, workers):
+    # A few chunks per worker balances the load without paying for
+    # one round-trip per task.
+    return max(1, -(-count // (workers * 4)))
+
+
+def map_payloads(
+    func, payloads, workers=None, chunksize=None, min_tasks=DEFAULT_MIN_TASKS
+):
+    """ Returns ``[func(payload) for payload in payloads]``.
+
+    ``func`` must be picklable (e.g. defined at the top level of a
+    module) whenever the work is handed to a process pool.
+
+    """
+    payloads = list(payloads)
+    if workers is None:
+        workers = get_default_workers()
+    workers = min(workers, len(payloads))
+    if workers < 2 or len(payloads) < min_tasks:
+        return [func(payload) for payload in payloads]
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    if chunksize is None:
+        chunksize = get_chunksize(len(payloads), workers)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(func, payloads, chunksize=chunksize))
@@ -0,0 +1,178 @@
+""" Timing instrumentation for the capsule pipeline.
+
+Profiling is enabled by setting the ``TW_CAPSULES_PROFILE`` environment
+variable or passing ``--capsules-profile`` as the first argument to
+``tw``.  Each phase of the pipeline (registry loading, capsule
+loading, validation, capsule handlers and the taskwarrior passthrough)
+is timed, and the ``task`` processes started during each phase are
+counted.  A summary is printed to standard error once the command
+finishes, and a JSON line is appended to the file named by
+``TW_CAPSULES_PROFILE_LOG`` if it is set.
+
+"""
+from contextlib import contextmanager
+import datetime
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+
+PROFILE_ENVIRONMENT_VARIABLE = 'TW_CAPSULES_PROFILE'
+PROFILE_LOG_ENVIRONMENT_VARIABLE = 'TW_CAPSULES_PROFILE_LOG'
+PROFILE_FLAG = '--capsules-profile'
+
+
+class NullProfiler(object):
+    enabled = False
+
+    @contextmanager
+    def phase(self, name, capsule=None):
+        yield
+
+    def count_subprocess(self, args):
+        pass
+
+
+class Profiler(object):
+    """ Records wall and CPU time for nested pipeline phases. """
+    enabled = True
+
+    def __init__(self):
+        self.records = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._original_popen_init = None
+
+    @property
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    @contextmanager
+    def phase(self, name, capsule=None):
+        record = {
+            'phase': name,
+            'capsule': capsule,
+            'depth': len(self._stack),
+            'subprocesses': 0,
+        }
+        with self._lock:
+            self.records.append(record)
+        self._stack.append(record)
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield
+        finally:
+            record['wall'] = time.perf_counter() - wall_start
+            record['cpu'] = time.process_time() - cpu_start
+            self._stack.pop()
+
+    def count_subprocess(self, args):
+        """ Attributes a ``task`` process to every active phase. """
+        if isinstance(args, (str, bytes)):
+            executable = args.split()[0] if args.split() else args
+        else:
+            executable = args[0] if args else ''
+        if isinstance(executable, bytes):
+            executable = executable.decode('utf-8', 'replace')
+        if os.path.basename(str(executable)) != 'task':
+            return
+        with self._lock:
+            for record in self._stack:
+                record['subprocesses'] += 1
+
+    def install(self):
+        """ Starts counting ``task`` processes started via ``subprocess``. """
+        original = subprocess.Popen.__init__
+        profiler = self
+
+        def counting_init(popen, args, *posargs, **kwargs):
+            profiler.count_subprocess(args)
+            return original(popen, args, *posargs, **kwargs)
+
+        self._original_popen_init = original
+        subprocess.Popen.__init__ = counting_init
+
+    def uninstall(self):
+        if self._original_popen_init is not None:
+            subprocess.Popen.__init__ = self._original_popen_init
+            self._original_popen_init = None
+
+    def report(self, stream=None):
+        if stream is None:
+            stream = sys.stderr
+        from blessings import Terminal
+        term = Terminal(stream=stream)
+
+        rows = [('Phase', 'Capsule', 'Wall (ms)', 'CPU (ms)', 'task', )]
+        for record in self.records:
+            rows.append((
+                '  ' * record['depth'] + record['phase'],
+                record['capsule'] or '',
+                '%.1f' % (record.get('wall', 0) * 1000),
+                '%.1f' % (record.get('cpu', 0) * 1000),
+                str(record['subprocesses']),
+            ))
+        widths = [
+            max(len(row[column]) for row in rows)
+            for column in range(len(rows[0]))
+        ]
+
+        def format_row(row):
+            return '  '.join(
+                cell.ljust(width) if column < 2 else cell.rjust(width)
+                for column, (cell, width) in enumerate(zip(row, widths))
+            )
+
+        stream.write(
+            f'{term.bold}{term.blue}{format_row(rows[0])}{term.normal}\n'
+        )
+        for row in rows[1:]:
+            stream.write(format_row(row) + '\n')
+        stream.flush()
+
+    def write_log(self, path, args):
+        entry = {
+            'time': datetime.datetime.utcnow().isoformat() + 'Z',
+            'args': args,
+            'phases': self.records,
+        }
+        with open(os.path.expanduser(path), 'a') as out:
+            out.write(json.dumps(entry) + '\n')
+
+
+_active = NullProfiler()
+
+
+def get_profiler():
+    return _active
+
+
+def activate(profiler):
+    global _active
+    _active = profiler
+    if profiler.enabled:
+        profiler.install()
+    return profiler
+
+
+def deactivate():
+    global _active
+    if _active.enabled:
+        _active.uninstall()
+    _active = NullProfiler()
+
+
+def profiling_requested(args):
+    """ Returns (enabled, args) with any profiling flag removed. """
+    enabled = os.environ.get(PROFILE_ENVIRONMENT_VARIABLE, '') not in (
+        '', '0',
+    )
+    if args and args[0] == PROFILE_FLAG:
+        return True, args[1:]
+    return enabled, args
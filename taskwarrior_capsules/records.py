@@ -0,0 +1,176 @@
+""" Compact, lazily-marshalled task records for large result sets.
+
+``taskw`` marshals every field of every task it returns -- building
+timezone-aware datetimes for each date, UUID objects for dependencies
+and so on -- whether or not a capsule ever looks at them.  For queries
+returning tens of thousands of tasks that is most of the work, and
+most of the memory.
+
+``TaskBatch`` instead stores the exported values column by column and
+hands out ``TaskRecord`` views onto single rows; a value is only
+marshalled (in the same way ``taskw`` would have) the first time it is
+read.  Use ``TaskRecord.to_task`` or ``TaskBatch.to_tasks`` wherever a
+real ``taskw`` task is needed.
+
+"""
+from collections.abc import Mapping
+
+
+# Marks cells whose marshalled value has not been computed yet.
+_UNMARSHALLED = object()
+
+
+class TaskRecord(Mapping):
+    """ A read-only, dictionary-like view of one task in a ``TaskBatch``. """
+    __slots__ = ('batch', 'index', )
+
+    def __init__(self, batch, index):
+        self.batch = batch
+        self.index = index
+
+    def __getitem__(self, key):
+        return self.batch.get_value(key, self.index)
+
+    def __contains__(self, key):
+        column = self.batch.columns.get(key)
+        return column is not None and column[self.index] is not None
+
+    def __iter__(self):
+        for key, column in self.batch.columns.items():
+            if column[self.index] is not None:
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return '<TaskRecord %s>' % self.get_raw('uuid')
+
+    def get_raw(self, key, default=None):
+        """ Returns ``key``'s value exactly as ``export`` produced it. """
+        column = self.batch.columns.get(key)
+        if column is None or column[self.index] is None:
+            return default
+        return column[self.index]
+
+    def to_dict(self):
+        """ Returns this task as ``export`` produced it. """
+        return self.batch.get_dict(self.index)
+
+    def to_task(self):
+        """ Returns this task as the capsule's client would have. """
+        return self.batch.client._get_task_object(self.to_dict())
+
+
+class TaskBatch(object):
+    """ Exported tasks stored as one list of values per field.
+
+    Indexing or iterating over a batch yields ``TaskRecord`` objects,
+    which are created on demand and hold nothing but their position.
+
+    """
+    def __init__(self, tasks, client):
+        self.client = client
+        self.length = 0
+        self.columns = {}
+        self._marshalled = {}
+        self._converters = None
+        for task in tasks:
+            self.append(task)
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [
+                TaskRecord(self, i) for i in range(*index.indices(self.length))
+            ]
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError(index)
+        return TaskRecord(self, index)
+
+    def __iter__(self):
+        for index in range(self.length):
+            yield TaskRecord(self, index)
+
+    def __repr__(self):
+        return '<TaskBatch of %s tasks>' % self.length
+
+    def append(self, task):
+        """ Adds ``task`` (a dictionary in ``export`` shape). """
+        for key, value in task.items():
+            column = self.columns.get(key)
+            if column is None:
+                column = [None] * self.length
+                self.columns[key] = column
+            column.append(value)
+        self.length += 1
+        for key, column in self.columns.items():
+            if len(column) < self.length:
+                column.append(None)
+        for column in self._marshalled.values():
+            column.append(_UNMARSHALLED)
+
+    @property
+    def converters(self):
+        """ The ``taskw`` fields used to marshal each attribute. """
+        if self._converters is None:
+            self._converters = {}
+            marshal = getattr(self.client, 'marshal', None)
+            if marshal is None:
+                # A plain ``taskw`` client.
+                marshal = getattr(self.client, '_marshal', False)
+            if marshal:
+                from taskw.task import Task
+
+                self._converters.update(self.client.config.get_udas())
+                self._converters.update(Task.FIELDS)
+        return self._converters
+
+    def get_value(self, key, index):
+        column = self.columns.get(key)
+        if column is None or column[index] is None:
+            raise KeyError(key)
+
+        converter = self.converters.get(key)
+        if converter is None:
+            return column[index]
+
+        marshalled = self._marshalled.get(key)
+        if marshalled is None:
+            marshalled = [_UNMARSHALLED] * self.length
+            self._marshalled[key] = marshalled
+        if marshalled[index] is _UNMARSHALLED:
+            marshalled[index] = converter.deserialize(column[index])
+        return marshalled[index]
+
+    def get_dict(self, index):
+        task = {}
+        for key, column in self.columns.items():
+            value = column[index]
+            if value is not None:
+                task[key] = list(value) if isinstance(value, list) else value
+        return task
+
+    def column(self, key, default=None):
+        """ Returns every task's (marshalled) value for ``key``. """
+        if key not in self.columns:
+            return [default] * self.length
+        return [
+            self.get_value(key, index)
+            if self.columns[key][index] is not None else default
+            for index in range(self.length)
+        ]
+
+    def to_dicts(self):
+        """ Returns every task as ``export`` produced it. """
+        return [self.get_dict(index) for index in range(self.length)]
+
+    def to_tasks(self):
+        """ Returns every task as the capsules' client would have. """
+        return [
+            self.client._get_task_object(task) for task in self.to_dicts()
+        ]
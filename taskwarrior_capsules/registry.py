@@ -0,0 +1,417 @@
+from collections.abc import Mapping
+import hashlib
+import importlib
+import os
+import sys
+
+from . import __version__
+from .cache import get_file_signature
+from .profiling import get_profiler
+
+
+ENTRY_POINT_GROUPS = {
+    'command': 'taskwarrior_capsules',
+    'preprocessor': 'taskwarrior_preprocessor_capsules',
+    'postprocessor': 'taskwarrior_postprocessor_capsules',
+}
+
+DISTRIBUTION_SUFFIXES = ('.dist-info', '.egg-info', '.egg-link', '.pth')
+
+
+def get_distribution_paths():
+    """ Returns the ``sys.path`` entries that may hold distributions.
+
+    ``sys.path[0]`` -- the running script's directory, or the current
+    directory for ``python -m`` and the interactive interpreter -- is
+    left out: entry points are only ever installed into the remaining
+    (site) locations, and including it would make the fingerprint
+    depend on how, and from where, the interpreter was started.
+
+    """
+    return [path for path in sys.path[1:] if path]
+
+
+def get_environment_fingerprint(paths=None):
+    """ Returns a digest describing the installed distributions.
+
+    The digest covers the distribution metadata (and its modification
+    time) found in each of ``paths`` (by default, those returned by
+    ``get_distribution_paths``); installing, upgrading or removing a
+    package (including editable installs) changes it.
+
+    """
+    if paths is None:
+        paths = get_distribution_paths()
+
+    digest = hashlib.sha1()
+    for path in paths:
+        try:
+            names = sorted(os.listdir(path))
+        except OSError:
+            continue
+        entries = []
+        for name in names:
+            if not name.endswith(DISTRIBUTION_SUFFIXES):
+                continue
+            for child in (name, os.path.join(name, 'entry_points.txt')):
+                try:
+                    mtime = os.stat(os.path.join(path, child)).st_mtime_ns
+                except OSError:
+                    continue
+                entries.append('%s:%s\n' % (child, mtime))
+        if not entries:
+            # Nothing here can provide entry points.
+            continue
+        digest.update(
+            ('%s\n%s' % (path, ''.join(entries))).encode(
+                'utf-8', 'surrogateescape'
+            )
+        )
+    return digest.hexdigest()
+
+
+def _iter_entry_points():
+    """ Yields (group, name, value, distribution, version) tuples. """
+    try:
+        from importlib import metadata
+    except ImportError:
+        metadata = None
+
+    groups = set(ENTRY_POINT_GROUPS.values())
+
+    if metadata is None:
+        import pkg_resources
+        for group in groups:
+            for entry_point in pkg_resources.iter_entry_points(group=group):
+                value = entry_point.module_name
+                if entry_point.attrs:
+                    value = '%s:%s' % (value, '.'.join(entry_point.attrs))
+                yield (
+                    group,
+                    entry_point.name,
+                    value,
+                    entry_point.dist.project_name,
+                    entry_point.dist.version,
+                )
+        return
+
+    for distribution in metadata.distributions():
+        for entry_point in distribution.entry_points:
+            if entry_point.group not in groups:
+                continue
+            yield (
+                entry_point.group,
+                entry_point.name,
+                entry_point.value,
+                distribution.metadata['Name'],
+                distribution.version,
+            )
+
+
+def scan_entry_points():
+    """ Collects capsule entry points for every variant.
+
+    Returns a dictionary mapping each variant to a dictionary of
+    capsule names to entries; each entry records the ``module:attr``
+    reference for the capsule class as well as the name and version of
+    the distribution providing it.  When several distributions provide
+    the same name, the first one found on ``sys.path`` wins.
+
+    """
+    variants = dict(
+        (group, variant) for variant, group in ENTRY_POINT_GROUPS.items()
+    )
+    entries = dict((variant, {}) for variant in ENTRY_POINT_GROUPS)
+    for group, name, value, distribution, version in _iter_entry_points():
+        entries[variants[group]].setdefault(
+            name,
+            {
+                'value': value,
+                'distribution': distribution,
+                'version': version,
+            }
+        )
+    return entries
+
+
+def load_entry_point_value(value):
+    """ Imports the object referenced by a ``module:attr`` string. """
+    module_name, _, attrs = value.partition(':')
+    # Strip any extras declaration (``module:attr [extra]``).
+    attrs = attrs.split('[')[0].strip()
+    loaded = importlib.import_module(module_name.strip())
+    if attrs:
+        for attr in attrs.split('.'):
+            loaded = getattr(loaded, attr)
+    return loaded
+
+
+def get_current_subscriptions(entry):
+    """ Returns the subscriptions recorded in ``entry``.
+
+    An empty dictionary is returned if none were recorded, or if the
+    module they were recorded from has changed since.
+
+    """
+    subscriptions = entry.get('subscriptions') or {}
+    source = subscriptions.get('source')
+    if not source or list(
+        get_file_signature(source) or ()
+    ) != subscriptions.get('signature'):
+        return {}
+    return subscriptions
+
+
+class CapsuleRegistry(object):
+    """ Persistent index of installed capsules.
+
+    Scanning entry points requires reading the metadata of every
+    installed distribution, so the result is stored in the metadata
+    folder and reused until the environment fingerprint (see
+    ``get_environment_fingerprint``) changes.  Capsule classes are only
+    imported when explicitly loaded.
+
+    """
+    CACHE_NAME = 'registry'
+
+    def __init__(self, meta):
+        self.meta = meta
+        self._fingerprint = None
+        self._entries = None
+        self._classes = {}
+        self._dispatch = {}
+
+    @property
+    def fingerprint(self):
+        if self._fingerprint is None:
+            self._fingerprint = get_environment_fingerprint()
+        return self._fingerprint
+
+    @property
+    def entries(self):
+        if self._entries is None:
+            with get_profiler().phase('registry'):
+                self._entries = self._load_entries()
+        return self._entries
+
+    def _load_entries(self):
+        cache = self.meta.get_cache(self.CACHE_NAME)
+        cached = cache.load()
+        if (
+            cached.get('fingerprint') == self.fingerprint
+            and cached.get('capsules_version') == __version__
+            and isinstance(cached.get('entries'), dict)
+        ):
+            return cached['entries']
+
+        entries = scan_entry_points()
+        self._save_entries(entries)
+        return entries
+
+    def _save_entries(self, entries):
+        self.meta.get_cache(self.CACHE_NAME).save({
+            'fingerprint': self.fingerprint,
+            'capsules_version': __version__,
+            'entries': entries,
+        })
+
+    def refresh(self):
+        self._fingerprint = None
+        self._entries = None
+        self._classes = {}
+        self._dispatch = {}
+
+    def get_names(self, variant='command'):
+        return list(self.entries.get(variant, {}).keys())
+
+    def get_entry(self, variant, name):
+        return self.entries.get(variant, {}).get(name)
+
+    def load(self, variant, name):
+        """ Imports the capsule class registered as ``name``.
+
+        Returns ``None`` if no such capsule exists, if it cannot be
+        imported, or if it does not subclass ``CommandCapsule``.
+
+        """
+        key = (variant, name, )
+        if key in self._classes:
+            return self._classes[key]
+
+        from .capsule import CommandCapsule
+
+        entry = self.get_entry(variant, name)
+        loaded_class = None
+        if entry is not None:
+            try:
+                loaded_class = load_entry_point_value(entry['value'])
+            except (ImportError, AttributeError):
+                loaded_class = None
+            if not (
+                isinstance(loaded_class, type)
+                and issubclass(loaded_class, CommandCapsule)
+            ):
+                loaded_class = None
+
+        self._classes[key] = loaded_class
+        if loaded_class is not None:
+            self.record_subscriptions(entry, loaded_class)
+        return loaded_class
+
+    def record_subscriptions(self, entry, capsule_class):
+        """ Stores the commands ``capsule_class`` subscribes to in ``entry``.
+
+        Along with them, whether the class asks to run in the background
+        and the signature of the module defining the class are stored;
+        all of it is forgotten once that module is edited.
+
+        """
+        source = getattr(
+            sys.modules.get(capsule_class.__module__), '__file__', None
+        )
+        subscriptions = {
+            'commands': capsule_class.get_subscriptions(),
+            'background': bool(
+                getattr(capsule_class, 'RUN_IN_BACKGROUND', False)
+            ),
+            'source': source,
+            'signature': list(get_file_signature(source) or ())
+            if source else None,
+        }
+        if entry.get('subscriptions') != subscriptions:
+            entry['subscriptions'] = subscriptions
+            self._dispatch = {}
+            self._save_entries(self.entries)
+
+    def get_dispatch_table(self, variant):
+        """ Returns ``(always, by_command)`` for capsules of ``variant``.
+
+        ``always`` is the set of capsules that must be considered for
+        every command -- those subscribing to every command, and those
+        whose subscriptions are not (or no longer) known -- and
+        ``by_command`` maps each command name to the set of capsules
+        subscribing to it.
+
+        """
+        if variant not in self._dispatch:
+            always = set()
+            by_command = {}
+            for name, entry in self.entries.get(variant, {}).items():
+                commands = get_current_subscriptions(entry).get('commands')
+                if commands is None:
+                    always.add(name)
+                    continue
+                for command_name in commands:
+                    by_command.setdefault(command_name, set()).add(name)
+            self._dispatch[variant] = (always, by_command, )
+        return self._dispatch[variant]
+
+    def subscribes(self, variant, name, command_name):
+        """ Whether capsule ``name`` may need to run for ``command_name``.
+
+        Answered from the registry alone; capsules whose subscriptions
+        are not yet known are assumed to subscribe.
+
+        """
+        always, by_command = self.get_dispatch_table(variant)
+        return name in always or name in by_command.get(command_name, ())
+
+    def runs_in_background(self, variant, name):
+        """ Whether capsule ``name`` asks to run in the background.
+
+        Answered from the registry when possible; otherwise the
+        capsule's class is loaded (but not instantiated) to find out.
+
+        """
+        entry = self.entries.get(variant, {}).get(name)
+        if entry is None:
+            return False
+        background = get_current_subscriptions(entry).get('background')
+        if background is None:
+            capsule_class = self.load(variant, name)
+            background = bool(
+                getattr(capsule_class, 'RUN_IN_BACKGROUND', False)
+            )
+        return background
+
+    def load_all(self, variant='command'):
+        capsules = {}
+        for name in self.get_names(variant):
+            loaded_class = self.load(variant, name)
+            if loaded_class is not None:
+                capsules[name] = loaded_class
+        return capsules
+
+
+class LazyCapsuleMapping(Mapping):
+    """ Maps capsule names to capsule instances, loading them on demand.
+
+    Membership tests and iteration only consult the registry; a
+    capsule's module is imported and its class instantiated the first
+    time the capsule itself is requested.  Capsules that cannot be
+    loaded behave as if they were not present when requested.
+
+    """
+    def __init__(self, variant, meta, client):
+        self.variant = variant
+        self.meta = meta
+        self.client = client
+        self._names = meta.registry.get_names(variant)
+        self._name_set = frozenset(self._names)
+        self._instances = {}
+
+    def __contains__(self, name):
+        return name in self._name_set
+
+    def __iter__(self):
+        return iter(self._names)
+
+    def __len__(self):
+        return len(self._names)
+
+    def subscribers(self, command_name):
+        """ Returns the names of capsules that may run for ``command_name``.
+
+        Capsules are neither imported nor instantiated to find out.
+
+        """
+        return [
+            name for name in self._names
+            if self.meta.registry.subscribes(self.variant, name, command_name)
+        ]
+
+    def runs_in_background(self, name):
+        """ Whether capsule ``name`` asks to run in the background.
+
+        The capsule is not instantiated to find out.
+
+        """
+        if name not in self._name_set:
+            return False
+        return self.meta.registry.runs_in_background(self.variant, name)
+
+    def get_subscriber(self, name, command_name):
+        """ Returns capsule ``name`` if it runs for ``command_name``. """
+        if not self.meta.registry.subscribes(
+            self.variant, name, command_name
+        ):
+            return None
+        capsule = self.get(name)
+        if capsule is None or not capsule.handles_command(command_name):
+            return None
+        return capsule
+
+    def __getitem__(self, name):
+        if name not in self._instances:
+            if name not in self._name_set:
+                raise KeyError(name)
+            with get_profiler().phase('load', capsule=name):
+                capsule_class = self.meta.registry.load(self.variant, name)
+                if capsule_class is None:
+                    raise KeyError(name)
+                self._instances[name] = capsule_class(
+                    self.meta,
+                    name,
+                    self.client,
+                )
+        return self._instances[name]
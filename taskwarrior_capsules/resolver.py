@@ -0,0 +1,244 @@
+""" Resolving command line words to command names.
+
+Taskwarrior accepts any unambiguous abbreviation of a command at least
+``abbreviation.minimum`` characters long (``tw mod`` for ``modify``),
+as well as user-defined ``alias.*`` commands.  ``CommandResolver``
+applies the same rules to taskwarrior's commands and reports, its
+aliases and the installed capsule commands using a prefix trie.
+
+Taskwarrior's commands and aliases are read from ``task _commands``
+and ``task _show`` and stored in the metadata folder, keyed on the
+``.taskrc`` file and the ``task`` binary, so ``task`` is only run again
+once either changes.  Until they have been read, command lines whose
+command is named in full and preceded only by words that are clearly
+filter terms are resolved without running ``task`` at all (see
+``parse_obvious_args``).
+
+"""
+import os
+import re
+import subprocess
+
+from .cache import get_file_signature
+from .data import BUILT_IN_COMMANDS, DEFAULT_REPORTS
+from .taskwarrior import get_task_binary_stamp
+
+
+DEFAULT_ABBREVIATION_MINIMUM = 2
+
+# Words that can only be filter terms (or configuration overrides):
+# tags, attributes, ids, UUIDs, patterns and parentheses.
+FILTER_TERM = re.compile(
+    r'^([+-]\w|rc[.:]|[\w.-]+[:=]|[\d,-]+$|[0-9a-f]{8}(-|$)|/|\(|\)$)'
+)
+
+_commands_cache = {}
+
+
+class CommandTrie(object):
+    """ A prefix trie mapping words to the names they abbreviate. """
+    __slots__ = ('children', 'name', 'count', 'only', )
+
+    def __init__(self):
+        self.children = {}
+        # The name ending at this node, if any.
+        self.name = None
+        # The number of names below this node, and the name if only one.
+        self.count = 0
+        self.only = None
+
+    def add(self, name):
+        existing = self.find(name)
+        if existing is not None and existing.name == name:
+            return
+        node = self
+        node.count += 1
+        node.only = name if node.count == 1 else None
+        for character in name:
+            node = node.children.setdefault(character, CommandTrie())
+            node.count += 1
+            node.only = name if node.count == 1 else None
+        node.name = name
+
+    def find(self, word):
+        node = self
+        for character in word:
+            node = node.children.get(character)
+            if node is None:
+                return None
+        return node
+
+    def resolve(self, word, minimum=DEFAULT_ABBREVIATION_MINIMUM):
+        """ Returns the name ``word`` is or abbreviates, or ``None``. """
+        node = self.find(word)
+        if node is None:
+            return None
+        if node.name is not None:
+            return node.name
+        if len(word) >= minimum and node.count == 1:
+            return node.only
+        return None
+
+
+def get_taskrc_path():
+    return os.path.expanduser(os.environ.get('TASKRC', '~/.taskrc'))
+
+
+def run_task_helper(*args):
+    """ Returns the output lines of a ``task`` helper command. """
+    try:
+        output = subprocess.run(
+            ['task', 'rc.verbose=nothing', 'rc.hooks=off'] + list(args),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            stdin=subprocess.DEVNULL,
+        ).stdout
+    except OSError:
+        return []
+    return output.decode('utf-8', 'replace').splitlines()
+
+
+def read_taskwarrior_commands():
+    """ Asks ``task`` for its commands, aliases and abbreviation minimum. """
+    commands = [
+        line.strip() for line in run_task_helper('_commands')
+        if line.strip() and not line.strip().startswith('_')
+    ]
+    aliases = {}
+    minimum = DEFAULT_ABBREVIATION_MINIMUM
+    for line in run_task_helper('_show'):
+        key, _, value = line.partition('=')
+        if key.startswith('alias.') and value.strip():
+            aliases[key[len('alias.'):]] = value.strip()
+        elif key == 'abbreviation.minimum':
+            try:
+                minimum = int(value)
+            except ValueError:
+                pass
+    return {
+        'commands': commands,
+        'aliases': aliases,
+        'abbreviation_minimum': minimum,
+    }
+
+
+def get_taskwarrior_commands(meta, probe=True):
+    """ Returns taskwarrior's commands, aliases and abbreviation minimum.
+
+    Memoized in-process and persisted in the metadata folder until the
+    ``.taskrc`` file or the ``task`` binary changes.  If ``probe`` is
+    ``False``, ``None`` is returned rather than running ``task``.
+
+    """
+    taskrc = get_taskrc_path()
+    key = [
+        taskrc,
+        list(get_file_signature(taskrc) or ()),
+        get_task_binary_stamp(),
+    ]
+    cached = _commands_cache.get(tuple(str(part) for part in key))
+    if cached is not None:
+        return cached
+
+    cache = meta.get_cache('taskwarrior_commands')
+    stored = cache.load()
+    if stored.get('key') == key and isinstance(stored.get('commands'), list):
+        commands = stored
+    elif key[2] is None:
+        # There's no ``task`` to ask.
+        commands = {
+            'commands': list(BUILT_IN_COMMANDS),
+            'aliases': {},
+            'abbreviation_minimum': DEFAULT_ABBREVIATION_MINIMUM,
+        }
+    elif not probe:
+        return None
+    else:
+        commands = read_taskwarrior_commands()
+        commands['key'] = key
+        cache.save(commands)
+
+    _commands_cache[tuple(str(part) for part in key)] = commands
+    return commands
+
+
+def parse_obvious_args(args, capsule_commands=()):
+    """ Splits ``args`` as ``CommandResolver.parse_args`` would.
+
+    Only answers when taskwarrior's configuration cannot matter -- the
+    command is a built-in command, default report or capsule command
+    named in full, and every word before it is a filter term -- and
+    returns ``None`` otherwise.  Aliases redefining a built-in command
+    or default report are not considered.
+
+    """
+    for idx, arg in enumerate(args):
+        if (
+            arg in capsule_commands
+            or arg in BUILT_IN_COMMANDS
+            or arg in DEFAULT_REPORTS
+        ):
+            return arg, args[0:idx], args[idx+1:]
+        if not FILTER_TERM.match(arg):
+            return None
+    return '', [], args[0:]
+
+
+class CommandResolver(object):
+    """ Finds the command in a ``tw`` command line.
+
+    ``taskwarrior`` is the result of ``get_taskwarrior_commands``, and
+    ``capsule_commands`` are the names of the installed capsule
+    commands.
+
+    """
+    def __init__(self, taskwarrior, capsule_commands=()):
+        self.taskwarrior = taskwarrior
+        self.aliases = taskwarrior.get('aliases', {})
+        self.minimum = taskwarrior.get(
+            'abbreviation_minimum', DEFAULT_ABBREVIATION_MINIMUM
+        )
+        self.trie = CommandTrie()
+        for name in capsule_commands:
+            self.trie.add(name)
+        for name in BUILT_IN_COMMANDS:
+            self.trie.add(name)
+        for name in DEFAULT_REPORTS:
+            self.trie.add(name)
+        for name in taskwarrior.get('commands', ()):
+            self.trie.add(name)
+        for name in self.aliases:
+            self.trie.add(name)
+
+    def resolve(self, word):
+        """ Returns ``(command_name, expansion)`` for ``word``, or ``None``.
+
+        ``expansion`` holds any further words an alias expands to.
+
+        """
+        name = self.trie.resolve(word, self.minimum)
+        if name is None:
+            return None
+        if name in self.aliases:
+            words = self.aliases[name].split()
+            # Aliases may themselves use abbreviations, but are not
+            # expanded again.
+            command_name = self.trie.resolve(words[0], self.minimum)
+            if command_name is None or command_name in self.aliases:
+                command_name = words[0]
+            return command_name, words[1:]
+        return name, []
+
+    def parse_args(self, args):
+        """ Splits ``args`` into ``(command_name, filter_args, extra_args)``.
+
+        As with taskwarrior, the first word naming a command is taken
+        to be the command.
+
+        """
+        for idx, arg in enumerate(args):
+            resolved = self.resolve(arg)
+            if resolved is not None:
+                command_name, expansion = resolved
+                return command_name, args[0:idx], expansion + args[idx+1:]
+        return '', [], args[0:]
@@ -0,0 +1,139 @@
+""" Replaying the output of read-only capsule commands.
+
+Command capsules setting ``CACHE_RESULTS`` have the text ``handle``
+writes to standard output, along with its return value, stored in the
+metadata folder.  Entries are keyed on everything the output may depend
+upon -- the capsule and its version, its arguments, the terminal, and
+(by default) the size and modification time of taskwarrior's data
+files -- so a repeated command is answered without running ``handle``
+until something changes.  The least recently used entries are removed
+once their total size exceeds ``max_bytes``.
+
+"""
+import glob
+import hashlib
+import io
+import os
+import pickle
+import sys
+
+from .cache import atomic_write, get_file_signature
+
+
+DEFAULT_MAX_BYTES = 16 * 1024 * 1024
+
+
+def get_data_fingerprint(data_location, taskrc=None):
+    """ Returns a value that changes whenever task data is modified. """
+    paths = sorted(glob.glob(os.path.join(data_location, '*.data')))
+    if taskrc:
+        paths.append(taskrc)
+    return [(path, get_file_signature(path), ) for path in paths]
+
+
+class TeeStream(object):
+    """ Passes writes through to ``stream`` while recording them. """
+    def __init__(self, stream):
+        self.stream = stream
+        self.captured = io.StringIO()
+
+    def write(self, text):
+        self.captured.write(text)
+        return self.stream.write(text)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+class ResultCache(object):
+    def __init__(self, folder, max_bytes=DEFAULT_MAX_BYTES):
+        self.folder = folder
+        self.max_bytes = max_bytes
+
+    def get_key(self, *parts):
+        return hashlib.sha1(
+            repr(parts).encode('utf-8', 'replace')
+        ).hexdigest()
+
+    def get_path(self, key):
+        return os.path.join(self.folder, '%s.pickle' % key)
+
+    def load(self, key):
+        """ Returns ``(output, result)`` stored for ``key``, or ``None``. """
+        path = self.get_path(key)
+        try:
+            with open(path, 'rb') as in_:
+                stored_key, output, result = pickle.load(in_)
+            # Mark the entry as recently used.
+            os.utime(path)
+        except Exception:
+            return None
+        if stored_key != key:
+            return None
+        return output.decode('utf-8'), result
+
+    def save(self, key, output, result):
+        try:
+            data = pickle.dumps(
+                (key, output.encode('utf-8'), result, ),
+                pickle.HIGHEST_PROTOCOL,
+            )
+        except (pickle.PicklingError, TypeError, AttributeError):
+            # ``result`` can't be stored; don't cache it.
+            return False
+        if len(data) > self.max_bytes:
+            return False
+        try:
+            if not os.path.isdir(self.folder):
+                os.makedirs(self.folder)
+            atomic_write(self.get_path(key), data)
+        except (IOError, OSError):
+            return False
+        self.evict()
+        return True
+
+    def evict(self):
+        """ Removes the least recently used entries beyond ``max_bytes``. """
+        entries = []
+        for path in glob.glob(os.path.join(self.folder, '*.pickle')):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, path, ))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+            total -= size
+
+    def run(self, key, function, *args, **kwargs):
+        """ Calls ``function``, or replays its output and result for ``key``.
+
+        Output is only stored when ``function`` returns normally.
+
+        """
+        cached = self.load(key)
+        if cached is not None:
+            output, result = cached
+            sys.stdout.write(output)
+            return result
+
+        stdout = sys.stdout
+        tee = TeeStream(stdout)
+        sys.stdout = tee
+        try:
+            result = function(*args, **kwargs)
+        finally:
+            sys.stdout = stdout
+        self.save(key, tee.captured.getvalue(), result)
+        return result
@@ -0,0 +1,112 @@
+""" Running many ``tw`` command lines in a single process.
+
+``tw --batch FILE`` (or ``-`` for standard input) reads command lines
+separated by newlines -- or by NUL characters, if the input contains
+any -- and runs each through the same ``Pipeline``, so the interpreter,
+installed capsules, configuration and caches are set up once rather
+than once per command.  Each line is split as a shell would split it;
+empty lines and lines starting with ``#`` are skipped.
+
+As each command finishes, its line number, exit code and command line
+are written, separated by tabs, to the status stream (standard error
+unless ``--status-file`` is given).
+
+"""
+import argparse
+import shlex
+import sys
+import traceback
+
+
+def read_command_lines(source):
+    """ Returns ``(line number, text)`` for every command in ``source``. """
+    if source == '-':
+        data = sys.stdin.read()
+    else:
+        with open(source, 'r') as in_:
+            data = in_.read()
+
+    separator = '\0' if '\0' in data else '\n'
+    lines = []
+    for number, line in enumerate(data.split(separator), 1):
+        line = line.strip()
+        if line and not line.startswith('#'):
+            lines.append((number, line, ))
+    return lines
+
+
+def get_exit_code(result):
+    """ Returns the exit code ``sys.exit(result)`` would have used. """
+    if result is None:
+        return 0
+    if isinstance(result, int):
+        return result
+    return 1
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        prog='tw --batch',
+        description='Run many tw command lines in a single process.',
+    )
+    parser.add_argument(
+        'source',
+        help='File to read command lines from, or - for standard input.',
+    )
+    parser.add_argument(
+        '--stop-on-error',
+        action='store_true',
+        help='Stop at the first command exiting unsuccessfully.',
+    )
+    parser.add_argument(
+        '--status-file',
+        help='File to write exit codes to rather than standard error.',
+    )
+    return parser
+
+
+def run_batch(args, pipeline=None):
+    """ Runs the command lines named by ``args``; returns an exit code.
+
+    The exit code is that of the first command that failed, or zero.
+
+    """
+    from .cmdline import Pipeline, run_command_line
+
+    options = get_parser().parse_args(args)
+    # Read everything up-front so that commands run below don't
+    # consume the rest of the batch from a shared standard input.
+    command_lines = read_command_lines(options.source)
+
+    if pipeline is None:
+        pipeline = Pipeline()
+    status = sys.stderr
+    if options.status_file:
+        status = open(options.status_file, 'a')
+
+    exit_code = 0
+    try:
+        for number, line in command_lines:
+            try:
+                code = get_exit_code(
+                    run_command_line(shlex.split(line), pipeline)
+                )
+            except SystemExit as e:
+                code = get_exit_code(e.code)
+            except Exception:
+                traceback.print_exc()
+                code = 1
+
+            sys.stdout.flush()
+            status.write('%s\t%s\t%s\n' % (number, code, line, ))
+            status.flush()
+
+            if code and not exit_code:
+                exit_code = code
+            if code and options.stop_on_error:
+                break
+    finally:
+        if status is not sys.stderr:
+            status.close()
+
+    return exit_code
@@ -0,0 +1,52 @@
+import threading
+
+from .data import BUILT_IN_COMMANDS, MUTATING_COMMANDS
+
+
+def command_may_mutate(command_name):
+    """ Whether running ``command_name`` through taskwarrior may alter tasks.
+
+    Only built-in commands known to be read-only are considered safe;
+    capsule commands, reports and unrecognised commands are not.
+
+    """
+    if command_name in MUTATING_COMMANDS:
+        return True
+    return command_name not in BUILT_IN_COMMANDS
+
+
+def args_may_mutate(args):
+    return any(arg in MUTATING_COMMANDS for arg in args)
+
+
+class TaskSnapshotCache(object):
+    """ Raw ``export`` output gathered during a single ``tw`` invocation.
+
+    Snapshots are keyed by the complete list of arguments passed to
+    ``task`` and hold the exported JSON text, so every consumer gets
+    freshly-built task objects it is free to modify.  The cache must be
+    invalidated whenever task data may have changed.
+
+    """
+    def __init__(self):
+        self._snapshots = {}
+        self._lock = threading.Lock()
+        self.generation = 0
+
+    def is_cacheable(self, args):
+        return 'export' in args and not args_may_mutate(args)
+
+    def get(self, args):
+        return self._snapshots.get(tuple(args))
+
+    def set(self, args, snapshot, generation=None):
+        with self._lock:
+            # Don't store results read before an invalidation.
+            if generation is not None and generation != self.generation:
+                return
+            self._snapshots[tuple(args)] = snapshot
+
+    def invalidate(self):
+        with self._lock:
+            self.generation += 1
+            self._snapshots.clear()
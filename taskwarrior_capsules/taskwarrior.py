@@ -0,0 +1,86 @@
+import os
+import shutil
+import subprocess
+
+
+_version_cache = {}
+
+
+def get_task_binary_stamp():
+    """ Returns a string identifying the installed ``task`` binary.
+
+    The stamp combines the binary's resolved path, modification time
+    and inode, so upgrading or replacing taskwarrior changes it.
+    Returns ``None`` if ``task`` cannot be found on the path.
+
+    """
+    path = shutil.which('task')
+    if not path:
+        return None
+    path = os.path.realpath(path)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return '%s:%s:%s' % (path, stat.st_mtime_ns, stat.st_ino, )
+
+
+def get_data_location(taskrc):
+    """ Returns taskwarrior's data folder without parsing ``taskrc`` fully.
+
+    ``TASKDATA`` wins; otherwise the last ``data.location`` set in
+    ``taskrc`` itself (not in files it includes) is used.
+
+    """
+    location = os.environ.get('TASKDATA')
+    if not location:
+        location = '~/.task'
+        try:
+            with open(taskrc, 'r') as in_:
+                for line in in_:
+                    key, _, value = line.partition('=')
+                    if key.strip() == 'data.location' and value.strip():
+                        location = value.split('#', 1)[0].strip()
+        except (IOError, OSError, UnicodeDecodeError):
+            pass
+    return os.path.expanduser(location)
+
+
+def get_taskwarrior_version_string(meta=None):
+    """ Returns the output of ``task --version``.
+
+    The version is memoized in-process and persisted in the metadata
+    folder, keyed on the ``task`` binary's stamp (see
+    ``get_task_binary_stamp``), so ``task`` is only executed again
+    once it has been replaced.
+
+    """
+    stamp = get_task_binary_stamp()
+    if stamp is not None and stamp in _version_cache:
+        return _version_cache[stamp]
+
+    if meta is None:
+        from .capsule_meta import CapsuleMeta
+        meta = CapsuleMeta()
+    cache = meta.get_cache('taskwarrior_version')
+
+    version = None
+    if stamp is not None:
+        cached = cache.load()
+        if cached.get('stamp') == stamp:
+            version = cached.get('version')
+
+    if not version:
+        version = subprocess.Popen(
+            ['task', '--version'],
+            stdout=subprocess.PIPE
+        ).communicate()[0].decode('utf-8', 'replace').strip()
+        if stamp is not None:
+            cache.save({
+                'stamp': stamp,
+                'version': version,
+            })
+
+    if stamp is not None:
+        _version_cache[stamp] = version
+    return version
@@ -0,0 +1,28 @@
+import pytest
+
+
+@pytest.fixture
+def home(tmp_path, monkeypatch):
+    """ An empty home folder, so no real configuration is touched. """
+    monkeypatch.setenv('HOME', str(tmp_path))
+    monkeypatch.delenv('TASKRC', raising=False)
+    monkeypatch.delenv('TASKDATA', raising=False)
+    return tmp_path
+
+
+@pytest.fixture
+def client(home, monkeypatch):
+    """ A marshalling ``CapsuleClient`` that never runs ``task``. """
+    from taskwarrior_capsules import client as client_module
+
+    monkeypatch.setattr(
+        client_module,
+        'get_taskwarrior_version_string',
+        lambda meta=None: '2.6.2',
+    )
+    taskrc = home / '.taskrc'
+    taskrc.write_text('data.location=%s\n' % (home / '.task'))
+    (home / '.task').mkdir()
+    return client_module.CapsuleClient(
+        config_filename=str(taskrc), marshal=True,
+    )
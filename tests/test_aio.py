@@ -0,0 +1,98 @@
+import asyncio
+import json
+import os
+import sys
+
+import pytest
+
+from taskwarrior_capsules.aio import AsyncCapsuleClient
+from taskwarrior_capsules.capsule import CommandCapsule
+from taskwarrior_capsules.capsule_meta import CapsuleMeta
+
+
+# Exports one task per project filter, keeping track of how many copies
+# of itself are running at once.
+STUB_TASK = '''
+import json, os, sys, time
+folder = os.environ['STUB_FOLDER']
+marker = os.path.join(folder, 'running.%s' % os.getpid())
+open(marker, 'w').close()
+running = len([n for n in os.listdir(folder) if n.startswith('running.')])
+with open(os.path.join(folder, 'log'), 'a') as out:
+    out.write('%s\\n' % running)
+time.sleep(0.5)
+os.unlink(marker)
+projects = [a.split(':', 1)[1] for a in sys.argv if a.startswith('project:')]
+print(json.dumps([
+    {'uuid': '8f5e8a5c-1a8b-4c3e-9a53-0c6b1b0d6a1%s' % i,
+     'description': p, 'status': 'pending', 'project': p}
+    for i, p in enumerate(projects)
+]))
+'''
+
+
+@pytest.fixture
+def stub(home, monkeypatch):
+    folder = home / 'stub'
+    folder.mkdir()
+    task = folder / 'task'
+    task.write_text('#!%s\n%s' % (sys.executable, STUB_TASK))
+    task.chmod(0o755)
+    monkeypatch.setenv('PATH', str(folder) + os.pathsep + os.environ['PATH'])
+    monkeypatch.setenv('STUB_FOLDER', str(folder))
+
+    def get_concurrency():
+        with open(str(folder / 'log')) as in_:
+            return [int(line) for line in in_]
+    return get_concurrency
+
+
+def test_concurrency_is_limited(client, stub):
+    async_client = AsyncCapsuleClient(client, concurrency=2)
+
+    async def export_all():
+        return await asyncio.gather(*[
+            async_client.export('project:p%s' % i) for i in range(5)
+        ])
+    results = asyncio.run(export_all())
+
+    assert [
+        [task['project'] for task in tasks] for tasks in results
+    ] == [['p%s' % i] for i in range(5)]
+    assert len(stub()) == 5
+    assert max(stub()) == 2
+
+
+def test_exports_are_shared_with_client(client, stub):
+    async_client = AsyncCapsuleClient(client)
+
+    tasks = asyncio.run(async_client.export('project:home'))
+    same = client._get_task_objects('project:home', 'status:pending', 'export')
+
+    assert len(stub()) == 1
+    assert [task['uuid'] for task in same] == [
+        task['uuid'] for task in tasks
+    ]
+
+
+class Report(CommandCapsule):
+    async def handle(self, filter_args, extra_args, **kwargs):
+        results = await asyncio.gather(*[
+            self.async_client.export('project:%s' % project)
+            for project in extra_args
+        ])
+        return json.dumps([len(tasks) for tasks in results])
+
+
+def test_async_handle_runs_on_event_loop(client, stub):
+    capsule = Report(CapsuleMeta(), 'report', client)
+
+    result = capsule.execute(
+        variant='command',
+        command_name='report',
+        filter_args=[],
+        extra_args=['home', 'work'],
+    )
+
+    assert result == '[1, 1]'
+    assert len(stub()) == 2
@@ -0,0 +1,110 @@
+import datetime
+import json
+
+import pytest
+from taskw.exceptions import TaskwarriorError
+from taskw.warrior import TaskWarriorShellout
+
+from taskwarrior_capsules.batch import TaskChangeBatch
+
+
+@pytest.fixture
+def stored(client, monkeypatch):
+    """ Tasks held by a stand-in for ``task import`` and ``export``. """
+    tasks = {}
+
+    def execute(self, *args):
+        if args[0] == 'import':
+            with open(args[1], 'r') as in_:
+                imported = json.load(in_)
+            for task in imported:
+                for annotation in task.get('annotations', ()):
+                    if not isinstance(annotation, dict):
+                        raise TaskwarriorError(
+                            args, 'Annotation is malformed.', '', 2,
+                        )
+                if not task['description']:
+                    raise TaskwarriorError(
+                        args, 'A task must have a description.', '', 2,
+                    )
+            for task in imported:
+                tasks[task['uuid']] = task
+            return '', ''
+        assert args[-1] == 'export'
+        return json.dumps([
+            tasks[uuid] for uuid in args[:-1] if uuid in tasks
+        ]), ''
+
+    monkeypatch.setattr(TaskWarriorShellout, '_execute', execute)
+    return tasks
+
+
+def test_add(client, stored):
+    batch = TaskChangeBatch(client)
+    uuid = batch.add(
+        'Water plants',
+        tags=['home'],
+        due=datetime.datetime(2020, 1, 2, tzinfo=datetime.timezone.utc),
+        annotations=['Use the blue can'],
+    )
+
+    result, = batch.apply()
+
+    assert result.success and result.uuid == uuid
+    assert stored[uuid]['due'] == '20200102T000000Z'
+    assert stored[uuid]['status'] == 'pending'
+    annotation, = stored[uuid]['annotations']
+    assert annotation['description'] == 'Use the blue can'
+    assert result.task['description'] == 'Water plants'
+
+
+def test_update_round_trips_annotations(client, stored):
+    uuid = '8f5e8a5c-1a8b-4c3e-9a53-0c6b1b0d6a11'
+    stored[uuid] = {
+        'uuid': uuid,
+        'description': 'Water plants',
+        'status': 'pending',
+        'entry': '20200101T000000Z',
+        'annotations': [
+            {'entry': '20200101T120000Z', 'description': 'Blue can'},
+        ],
+    }
+    task, = client._get_task_objects(uuid, 'export')
+    task['tags'] = ['home']
+
+    batch = TaskChangeBatch(client)
+    batch.update(task)
+    result, = batch.apply()
+
+    assert result.success
+    assert stored[uuid]['tags'] == ['home']
+    assert stored[uuid]['annotations'] == [
+        {'entry': '20200101T120000Z', 'description': 'Blue can'},
+    ]
+
+
+def test_unmarshalled_client_serializes_datetimes(client, stored):
+    client._marshal = False
+    batch = TaskChangeBatch(client)
+    uuid = batch.add(
+        'Water plants',
+        due=datetime.datetime(2020, 1, 2, tzinfo=datetime.timezone.utc),
+    )
+
+    result, = batch.apply()
+
+    assert result.success
+    assert stored[uuid]['due'] == '20200102T000000Z'
+
+
+def test_failures_are_reported_per_task(client, stored):
+    batch = TaskChangeBatch(client, chunk_size=10)
+    good = batch.add('Water plants')
+    bad = batch.add('')
+
+    results = dict((result.uuid, result) for result in batch.apply())
+
+    assert results[good].success
+    assert not results[bad].success
+    assert results[bad].error == 'A task must have a description.'
+    assert bad not in stored
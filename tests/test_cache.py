@@ -0,0 +1,74 @@
+import os
+
+import pytest
+
+from taskwarrior_capsules import cache
+
+
+@pytest.fixture
+def config_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, '_configs', {})
+    folder = tmp_path / 'cache'
+    folder.mkdir()
+    return cache.ConfigCache(str(folder))
+
+
+def write(path, text, mtime_ns):
+    path.write_text(text)
+    # Signatures include the modification time; make changes visible
+    # however coarse the filesystem's timestamps are.
+    os.utime(str(path), ns=(mtime_ns, mtime_ns))
+
+
+def test_load_is_shared_in_process(tmp_path, config_cache):
+    path = tmp_path / 'capsules.conf'
+    write(path, 'name = one\n', 10 ** 18)
+
+    config = config_cache.load(str(path))
+
+    assert config['name'] == 'one'
+    assert config_cache.load(str(path)) is config
+
+
+def test_load_unpickles_unchanged_files(tmp_path, config_cache, monkeypatch):
+    path = tmp_path / 'capsules.conf'
+    write(path, '[section]\nname = one\n', 10 ** 18)
+    config_cache.load(str(path))
+    monkeypatch.setattr(cache, '_configs', {})
+    # Same size and modification time: only the pickle can say ``one``.
+    write(path, '[section]\nname = six\n', 10 ** 18)
+
+    config = config_cache.load(str(path))
+
+    assert config['section']['name'] == 'one'
+    assert config.filename == str(path)
+
+
+def test_changed_files_are_parsed_again(tmp_path, config_cache, monkeypatch):
+    path = tmp_path / 'capsules.conf'
+    write(path, 'name = one\n', 10 ** 18)
+    config_cache.load(str(path))
+
+    write(path, 'name = two\n', 10 ** 18 + 10 ** 9)
+    assert config_cache.load(str(path))['name'] == 'two'
+
+    # Another process sees the change too.
+    monkeypatch.setattr(cache, '_configs', {})
+    assert config_cache.load(str(path))['name'] == 'two'
+
+
+def test_save_writes_atomically_and_keeps_cache(
+    tmp_path, config_cache, monkeypatch
+):
+    path = tmp_path / 'capsules.conf'
+    write(path, 'name = one\n', 10 ** 18)
+    config = config_cache.load(str(path))
+    config['name'] = 'two'
+
+    config_cache.save(config)
+
+    assert path.read_text() == 'name = two\n'
+    assert sorted(os.listdir(str(tmp_path))) == ['cache', 'capsules.conf']
+    assert config_cache.load(str(path)) is config
+    monkeypatch.setattr(cache, '_configs', {})
+    assert config_cache.load(str(path))['name'] == 'two'
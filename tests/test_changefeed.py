@@ -0,0 +1,129 @@
+import datetime
+
+import pytest
+
+from taskwarrior_capsules.cache import JSONCache
+from taskwarrior_capsules.changefeed import ChangeFeed
+
+
+def transaction(time, new, old=None):
+    lines = ['time %s' % time]
+    if old is not None:
+        lines.append('old %s' % old)
+    lines.append('new %s' % new)
+    lines.append('---')
+    return ''.join(line + '\n' for line in lines)
+
+
+ADD = transaction(
+    1600000000,
+    '[description:"Buy milk" entry:"1600000000" status:"pending" '
+    'uuid:"a"]',
+)
+MODIFY = transaction(
+    1600000100,
+    '[description:"Buy oat milk" entry:"1600000000" status:"pending" '
+    'uuid:"a"]',
+    '[description:"Buy milk" entry:"1600000000" status:"pending" '
+    'uuid:"a"]',
+)
+DONE = transaction(
+    1600000200,
+    '[description:"Buy oat milk" end:"1600000200" entry:"1600000000" '
+    'status:"completed" uuid:"a"]',
+    '[description:"Buy oat milk" entry:"1600000000" status:"pending" '
+    'uuid:"a"]',
+)
+
+
+@pytest.fixture
+def undo(tmp_path):
+    return tmp_path / 'undo.data'
+
+
+def get_feed(undo, **kwargs):
+    cache = JSONCache(str(undo.parent / 'feed.json'))
+    return ChangeFeed(str(undo), cache, **kwargs)
+
+
+def consume(feed):
+    changes = feed.read()
+    feed.commit()
+    return [
+        (
+            change.old['description'] if change.old else None,
+            change.new['description'],
+        )
+        for change in changes
+    ]
+
+
+def test_missing_file(undo):
+    assert get_feed(undo).read() == []
+
+
+def test_reads_appended_changes_once(undo):
+    undo.write_text(ADD)
+    feed = get_feed(undo)
+
+    changes = feed.read()
+    feed.commit()
+
+    assert len(changes) == 1
+    assert changes[0].old is None
+    assert changes[0].new['description'] == 'Buy milk'
+    assert changes[0].new['entry'] == '20200913T122640Z'
+    assert changes[0].time == datetime.datetime(
+        2020, 9, 13, 12, 26, 40, tzinfo=datetime.timezone.utc
+    )
+
+    with undo.open('a') as out:
+        out.write(MODIFY)
+
+    assert consume(get_feed(undo)) == [('Buy milk', 'Buy oat milk')]
+    assert consume(get_feed(undo)) == []
+
+
+def test_uncommitted_changes_are_read_again(undo):
+    undo.write_text(ADD)
+
+    assert len(get_feed(undo).read()) == 1
+    assert len(get_feed(undo).read()) == 1
+
+
+def test_truncated_trailing_record_waits_until_complete(undo):
+    partial = MODIFY[:MODIFY.index('new ') + 10]
+    undo.write_text(ADD + partial)
+
+    assert consume(get_feed(undo)) == [(None, 'Buy milk')]
+
+    undo.write_text(ADD + MODIFY)
+
+    assert consume(get_feed(undo)) == [('Buy milk', 'Buy oat milk')]
+
+
+def test_rewritten_file_is_replayed(undo):
+    undo.write_text(ADD + MODIFY)
+    consume(get_feed(undo))
+
+    # ``task undo`` removed the last transaction, and another was added.
+    undo.write_text(ADD + DONE)
+
+    assert consume(get_feed(undo)) == [
+        (None, 'Buy milk'), ('Buy oat milk', 'Buy oat milk'),
+    ]
+
+
+def test_rewritten_file_without_replay_skips_to_end(undo):
+    undo.write_text(ADD + MODIFY)
+    consume(get_feed(undo))
+    undo.write_text(ADD + DONE)
+
+    assert consume(get_feed(undo, replay_on_reset=False)) == []
+
+    with undo.open('a') as out:
+        out.write(MODIFY)
+
+    assert consume(get_feed(undo, replay_on_reset=False)) == [
+        ('Buy milk', 'Buy oat milk'),
+    ]
@@ -0,0 +1,140 @@
+import os
+import socket
+import subprocess
+import sys
+
+import pytest
+
+from taskwarrior_capsules import daemon
+
+
+def test_taskrc_state_follows_environment(tmp_path):
+    taskrc = tmp_path / 'custom.taskrc'
+
+    path, signature = daemon.get_taskrc_state({'TASKRC': str(taskrc)})
+    assert (path, signature) == (str(taskrc), None)
+
+    taskrc.write_text('verbose=nothing\n')
+    assert daemon.get_taskrc_state({'TASKRC': str(taskrc)})[1] is not None
+
+
+def test_taskrc_state_defaults_to_home(tmp_path):
+    path, _ = daemon.get_taskrc_state({'HOME': str(tmp_path)})
+
+    assert path == os.path.join(str(tmp_path), '.taskrc')
+
+
+def listen(home):
+    path = daemon.get_socket_path()
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen(1)
+    return server
+
+
+def test_client_runs_daemon_locally(home, monkeypatch):
+    calls = []
+    monkeypatch.setattr(daemon, '_run_locally', calls.append)
+
+    server = listen(home)
+    try:
+        daemon.client_main(['--daemon'])
+    finally:
+        server.close()
+
+    assert calls == [['--daemon']]
+
+
+def test_client_falls_back_when_streams_cannot_be_passed(home, monkeypatch):
+    calls = []
+    monkeypatch.setattr(daemon, '_run_locally', calls.append)
+
+    def sendmsg(self, *args):
+        raise OSError(9, 'Bad file descriptor')
+    monkeypatch.setattr(socket.socket, 'sendmsg', sendmsg)
+
+    server = listen(home)
+    try:
+        daemon.client_main(['next'])
+    finally:
+        server.close()
+
+    assert calls == [['next']]
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVE = '''
+import sys
+from taskwarrior_capsules import daemon
+daemon.REQUEST_TIMEOUT = float(sys.argv[1])
+sys.exit(daemon.serve())
+'''
+
+# Reports whether the command ran in the daemon's session, but in a
+# process group of its own.
+REPORT = '''
+import os
+import sys
+from taskwarrior_capsules import daemon, cmdline
+
+def run_command_line(args, pipeline=None):
+    print(os.getsid(0) == int(os.environ['DAEMON_SID']),
+          os.getpgid(0) == os.getpid())
+cmdline.run_command_line = run_command_line
+'''
+
+
+@pytest.fixture
+def daemon_env(home):
+    bin_folder = home / 'bin'
+    bin_folder.mkdir()
+    task = bin_folder / 'task'
+    task.write_text('#!/bin/sh\nexec "%s" "%s" "$@"\n' % (
+        sys.executable, os.path.join(ROOT, 'benchmarks', 'stub_task.py'),
+    ))
+    task.chmod(0o755)
+    (home / '.task').mkdir()
+    (home / '.taskrc').write_text('data.location=%s\n' % (home / '.task'))
+
+    env = dict(os.environ)
+    env.update({
+        'HOME': str(home),
+        'PATH': str(bin_folder) + os.pathsep + env.get('PATH', ''),
+        'PYTHONPATH': ROOT,
+        'BENCH_TASK_LOG': str(home / 'task.log'),
+        'BENCH_TASK_COUNT': '1',
+    })
+    return env
+
+
+@pytest.mark.skipif(not hasattr(socket, 'AF_UNIX'), reason='needs sockets')
+def test_stalled_client_does_not_block_others(home, daemon_env):
+    server = subprocess.Popen(
+        [sys.executable, '-c', REPORT + SERVE, '0.5'],
+        env=dict(daemon_env, DAEMON_SID='0'),
+        stdout=subprocess.PIPE,
+        start_new_session=True,
+    )
+    try:
+        server.stdout.readline()  # tw daemon listening on ...
+        stalled = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stalled.connect(daemon.get_socket_path())
+
+        client = subprocess.run(
+            [
+                sys.executable, '-c',
+                'from taskwarrior_capsules.daemon import client_main; '
+                'client_main(["next"])',
+            ],
+            env=dict(daemon_env, DAEMON_SID=str(server.pid)),
+            stdout=subprocess.PIPE,
+            timeout=30,
+        )
+        stalled.close()
+    finally:
+        server.terminate()
+        server.wait()
+
+    assert client.returncode == 0
+    assert client.stdout.decode('utf-8').split() == ['True', 'True']
@@ -0,0 +1,125 @@
+import pytest
+
+from taskwarrior_capsules.datafile import TaskDataReader, parse_filter
+
+
+TASKS = [
+    {
+        'uuid': 'a',
+        'status': 'pending',
+        'project': 'home.garden',
+        'tags': ['weekend'],
+        'due': '20200102T000000Z',
+    },
+    {
+        'uuid': 'b',
+        'status': 'pending',
+        'project': 'work',
+    },
+    {
+        'uuid': 'c',
+        'status': 'completed',
+        'tags': ['weekend', 'errand'],
+        'due': '20200301T120000Z',
+    },
+]
+
+
+def matching(filter_args):
+    predicates = parse_filter(filter_args)
+    return [
+        task['uuid'] for task in TASKS
+        if all(predicate(task) for predicate in predicates)
+    ]
+
+
+@pytest.mark.parametrize('filter_args, uuids', [
+    ([], ['a', 'b', 'c']),
+    (['+weekend'], ['a', 'c']),
+    (['-weekend'], ['b']),
+    (['+weekend', '-errand'], ['a']),
+    (['status:pending'], ['a', 'b']),
+    (['status.not:pending'], ['c']),
+    (['uuid:b'], ['b']),
+    (['project:home'], ['a']),
+    (['project.is:home'], []),
+    (['project.is:home.garden'], ['a']),
+    (['project.not:home'], ['b', 'c']),
+    (['project:'], ['c']),
+    (['due.none:'], ['b']),
+    (['due.any:'], ['a', 'c']),
+    (['due.before:2020-02-01'], ['a']),
+    (['due.after:2020-02-01'], ['c']),
+])
+def test_supported_filters(filter_args, uuids):
+    assert matching(filter_args) == uuids
+
+
+@pytest.mark.parametrize('filter_args', [
+    ['+OVERDUE'],
+    ['description:foo bar'],
+    ['groceries'],
+    ['project.startswith:home'],
+    ['due.before:tomorrow'],
+    ['due.none:x'],
+    ['urgency.over:5'],
+    [''],
+])
+def test_unsupported_filters(filter_args):
+    assert parse_filter(filter_args) is None
+
+
+class Client(object):
+    def __init__(self, location, udas=None):
+        self.config = {
+            'data': {'location': location},
+            'uda': udas or {},
+        }
+
+
+@pytest.fixture
+def data(tmp_path, monkeypatch):
+    monkeypatch.delenv('TASKDATA', raising=False)
+    (tmp_path / 'pending.data').write_text(
+        '[description:"Water plants" entry:"1600000000" estimate:"3" '
+        'status:"pending" tags:"home,weekend" uuid:"a" '
+        'annotation_1600000100:"Blue can"]\n'
+    )
+    return str(tmp_path)
+
+
+def test_tasks_are_converted_to_export_shape(data):
+    task, = TaskDataReader(Client(data)).get_tasks([])
+
+    assert task == {
+        'id': 1,
+        'uuid': 'a',
+        'description': 'Water plants',
+        'entry': '20200913T122640Z',
+        'estimate': '3',
+        'status': 'pending',
+        'tags': ['home', 'weekend'],
+        'annotations': [
+            {'entry': '20200913T122820Z', 'description': 'Blue can'},
+        ],
+    }
+
+
+def test_changed_uda_types_are_applied(data):
+    assert TaskDataReader(Client(data)).get_tasks([])[0]['estimate'] == '3'
+
+    reader = TaskDataReader(Client(data, {'estimate': {'type': 'numeric'}}))
+
+    assert reader.get_tasks([])[0]['estimate'] == 3
+
+
+def test_modifying_returned_tasks_leaves_cache_alone(data):
+    reader = TaskDataReader(Client(data))
+    task, = reader.get_tasks([])
+    task['tags'].append('errand')
+    task['annotations'][0]['description'] = 'Red can'
+
+    task, = reader.get_tasks([])
+
+    assert task['tags'] == ['home', 'weekend']
+    assert task['annotations'][0]['description'] == 'Blue can'
@@ -0,0 +1,46 @@
+import io
+
+import pytest
+
+from taskwarrior_capsules.export import iter_json_array
+
+
+def iterate(data, read_size=3):
+    return list(iter_json_array(io.BytesIO(data), read_size=read_size))
+
+
+@pytest.mark.parametrize('read_size', [1, 2, 7, 65536])
+def test_elements_split_across_reads(read_size):
+    data = (
+        b'[\n{"uuid": "a", "tags": ["x", "y"]},\n'
+        b'{"description": "caf\xc3\xa9"}, 12, 3.5, "s", [1, 2]\n]\n'
+    )
+
+    assert iterate(data, read_size) == [
+        {'uuid': 'a', 'tags': ['x', 'y']},
+        {'description': u'caf\xe9'},
+        12,
+        3.5,
+        's',
+        [1, 2],
+    ]
+
+
+def test_number_at_end_of_read_is_not_cut_short():
+    assert iterate(b'[1234, 5678]', read_size=2) == [1234, 5678]
+
+
+@pytest.mark.parametrize('data', [b'', b'  \n', b'[]', b'[ ]\n'])
+def test_empty(data):
+    assert iterate(data) == []
+
+
+@pytest.mark.parametrize('data', [b'[{"uuid": "a"}', b'[{"uuid": "a"}, {"u'])
+def test_truncated(data):
+    with pytest.raises(ValueError):
+        iterate(data)
+
+
+def test_not_an_array():
+    with pytest.raises(ValueError):
+        iterate(b'{"uuid": "a"}')
@@ -0,0 +1,65 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs a passthrough command line up to the point ``task`` would replace
+# the process, then reports the modules imported by then.
+PASSTHROUGH = '''
+import json
+import os
+import sys
+
+def execvp(file, args):
+    sys.stdout.write(json.dumps(sorted(sys.modules)))
+    sys.stdout.flush()
+    os._exit(0)
+os.execvp = execvp
+
+from taskwarrior_capsules.cmdline import main
+main(['next'])
+'''
+
+DEFERRED_MODULES = (
+    'blessings',
+    'concurrent.futures',
+    'configobj',
+    'taskw',
+    'verlib',
+)
+
+
+def get_passthrough_modules(home):
+    env = dict(os.environ)
+    env['HOME'] = str(home)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [ROOT] + [path for path in [env.get('PYTHONPATH')] if path]
+    )
+    env.pop('TASKRC', None)
+    env.pop('TASKDATA', None)
+    output = subprocess.run(
+        [sys.executable, '-c', PASSTHROUGH],
+        env=env,
+        cwd=str(home),
+        stdout=subprocess.PIPE,
+        check=True,
+    ).stdout
+    return set(json.loads(output.decode('utf-8')))
+
+
+@pytest.mark.skipif(os.name != 'posix', reason='passthrough uses exec')
+@pytest.mark.parametrize('start', ['cold', 'warm'])
+def test_passthrough_defers_heavy_imports(tmp_path, start):
+    if start == 'warm':
+        get_passthrough_modules(tmp_path)
+
+    modules = get_passthrough_modules(tmp_path)
+
+    assert sorted(
+        name for name in DEFERRED_MODULES if name in modules
+    ) == []
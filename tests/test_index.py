@@ -0,0 +1,60 @@
+from taskwarrior_capsules.index import TaskIndex, to_export
+
+
+def test_duplicate_tags_are_indexed_once():
+    index = TaskIndex([
+        {'uuid': 'a', 'status': 'pending', 'tags': ['home', 'home']},
+    ])
+
+    assert [task['uuid'] for task in index.by_tag('home')] == ['a']
+
+    index.discard('a')
+
+    assert index.by_tag('home') == []
+    assert index.tags() == []
+
+
+def test_update_moves_task_between_buckets():
+    index = TaskIndex([
+        {'uuid': 'a', 'status': 'pending', 'project': 'home'},
+        {'uuid': 'b', 'status': 'pending', 'project': 'home'},
+    ])
+
+    index.update({'uuid': 'a', 'status': 'completed', 'project': 'work'})
+
+    assert [task['uuid'] for task in index.by_project('home')] == ['b']
+    assert [task['uuid'] for task in index.by_status('completed')] == ['a']
+
+
+def test_range_is_ordered_and_half_open():
+    index = TaskIndex([
+        {'uuid': 'a', 'status': 'pending', 'due': '20200301T000000Z'},
+        {'uuid': 'b', 'status': 'pending', 'due': '20200101T000000Z'},
+        {'uuid': 'c', 'status': 'pending'},
+    ])
+
+    assert [
+        task['uuid'] for task in index.range('due')
+    ] == ['b', 'a']
+    assert [
+        task['uuid'] for task in index.range(
+            'due', '20200101T000000Z', '20200301T000000Z',
+        )
+    ] == ['b']
+
+
+def test_to_export_lists_annotations_as_export_does(client):
+    task = client._get_task_object({
+        'uuid': '8f5e8a5c-1a8b-4c3e-9a53-0c6b1b0d6a11',
+        'description': 'Water plants',
+        'annotations': [
+            {'entry': '20200101T120000Z', 'description': 'Blue can'},
+        ],
+    })
+    task['annotations'].append('Twice a week')
+
+    first, second = to_export(task)['annotations']
+
+    assert first == {'entry': '20200101T120000Z', 'description': 'Blue can'}
+    assert second['description'] == 'Twice a week'
+    assert len(second['entry']) == len('20200101T120000Z')
@@ -0,0 +1,52 @@
+import os
+
+from taskwarrior_capsules.capsule import CommandCapsule
+from taskwarrior_capsules.capsule_meta import CapsuleMeta
+from taskwarrior_capsules.pool import get_chunksize, map_payloads
+
+
+def describe(task):
+    return (os.getpid(), task['description'].upper())
+
+
+def test_small_inputs_are_processed_here():
+    results = map_payloads(
+        describe, [{'description': 'a'}, {'description': 'b'}], workers=4,
+    )
+
+    assert results == [(os.getpid(), 'A'), (os.getpid(), 'B')]
+
+
+def test_large_inputs_use_worker_processes():
+    payloads = [{'description': 'task %s' % i} for i in range(40)]
+
+    results = map_payloads(describe, payloads, workers=2, min_tasks=10)
+
+    assert [result for _, result in results] == [
+        'TASK %s' % i for i in range(40)
+    ]
+    assert os.getpid() not in set(pid for pid, _ in results)
+
+
+def test_chunksize():
+    assert get_chunksize(1, 4) == 1
+    assert get_chunksize(1000, 4) == 63
+
+
+def test_map_tasks_passes_export_shaped_tasks(client):
+    capsule = CommandCapsule(CapsuleMeta(), 'example', client)
+    task = client._get_task_object({
+        'uuid': '8f5e8a5c-1a8b-4c3e-9a53-0c6b1b0d6a11',
+        'description': 'Water plants',
+        'due': '20200102T000000Z',
+        'annotations': [
+            {'entry': '20200101T120000Z', 'description': 'Blue can'},
+        ],
+    })
+
+    exported, = capsule.map_tasks(dict, [task])
+
+    assert exported['due'] == '20200102T000000Z'
+    assert exported['annotations'] == [
+        {'entry': '20200101T120000Z', 'description': 'Blue can'},
+    ]
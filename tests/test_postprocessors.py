@@ -0,0 +1,127 @@
+import json
+import threading
+
+from taskwarrior_capsules import cmdline
+from taskwarrior_capsules.capsule_meta import CapsuleMeta
+
+
+class FakeWorker(object):
+    def __init__(self, *args, **kwargs):
+        self.kwargs = kwargs
+        self.written = b''
+        self.stdin = self
+
+    def write(self, data):
+        self.written += data
+
+    def close(self):
+        pass
+
+
+class FakeMapping(dict):
+    """ Postprocessors as a ``LazyCapsuleMapping`` would provide them. """
+    def __init__(self, background):
+        super(FakeMapping, self).__init__((name, None) for name in background)
+        self.background = background
+        self.instantiated = []
+
+    def runs_in_background(self, name):
+        return self.background[name]
+
+    def subscribers(self, command_name):
+        return list(self)
+
+    def get_subscriber(self, name, command_name):
+        self.instantiated.append(name)
+        return None
+
+
+def run(postprocessors, monkeypatch, result=0):
+    workers = []
+
+    def popen(*args, **kwargs):
+        workers.append(FakeWorker(*args, **kwargs))
+        return workers[-1]
+
+    monkeypatch.setattr(cmdline.subprocess, 'Popen', popen)
+    errors = cmdline.run_postprocessors(
+        postprocessors,
+        meta=CapsuleMeta(),
+        command_name='list',
+        filter_args=[],
+        extra_args=[],
+        result=result,
+    )
+    return errors, workers
+
+
+def test_background_capsules_are_not_instantiated(home, monkeypatch):
+    postprocessors = FakeMapping({'slow': True, 'fast': False})
+
+    errors, workers = run(postprocessors, monkeypatch)
+
+    assert errors == []
+    assert postprocessors.instantiated == ['fast']
+    assert json.loads(workers[0].written.decode('utf-8'))['capsules'] == [
+        'slow',
+    ]
+
+
+def test_background_worker_does_not_start_in_current_directory(
+    home, monkeypatch
+):
+    errors, workers = run(FakeMapping({'slow': True}), monkeypatch)
+
+    assert workers[0].kwargs['cwd'] == CapsuleMeta().metadata_folder
+
+
+def test_non_json_result_is_passed_as_string(home, monkeypatch):
+    result = object()
+
+    errors, workers = run(FakeMapping({'slow': True}), monkeypatch, result)
+
+    assert errors == []
+    assert json.loads(workers[0].written.decode('utf-8'))['result'] == (
+        str(result)
+    )
+
+
+class Processor(object):
+    RUN_IN_BACKGROUND = False
+
+    def __init__(self, parallel_safe, barrier=None, error=None):
+        self.PARALLEL_SAFE = parallel_safe
+        self.barrier = barrier
+        self.error = error
+        self.calls = []
+
+    def handles_command(self, command_name):
+        return command_name == 'list'
+
+    def execute(self, **kwargs):
+        self.calls.append(kwargs['capsule_name'])
+        if self.barrier is not None:
+            # Only passes once every parallel postprocessor is running.
+            self.barrier.wait(timeout=5)
+        if self.error is not None:
+            raise self.error
+
+
+def test_parallel_safe_postprocessors_run_concurrently(home, monkeypatch):
+    barrier = threading.Barrier(2)
+    error = ValueError('Failed')
+    postprocessors = {
+        'first': Processor(True, barrier),
+        'second': Processor(True, barrier, error),
+        'serial': Processor(False),
+        'other': Processor(False),
+    }
+    postprocessors['other'].handles_command = lambda command_name: False
+
+    errors, workers = run(postprocessors, monkeypatch)
+
+    assert errors == [('second', error)]
+    assert workers == []
+    assert [
+        processor.calls for processor in postprocessors.values()
+    ] == [['first'], ['second'], ['serial'], []]
@@ -0,0 +1,59 @@
+import datetime
+import uuid
+
+from taskwarrior_capsules.records import TaskBatch
+
+
+TASKS = [
+    {
+        'uuid': '0f8a2c4e-7d1b-4c5a-9e3f-2b6d8a1c4e7f',
+        'description': 'First',
+        'entry': '20240101T000000Z',
+        'due': '20240201T120000Z',
+        'tags': ['home'],
+    },
+    {
+        'uuid': '1a2b3c4d-5e6f-4a8b-9c0d-1e2f3a4b5c6d',
+        'description': 'Second',
+        'entry': '20240102T000000Z',
+    },
+]
+
+
+def test_compact_record_marshals_dates(client):
+    batch = TaskBatch(TASKS, client)
+
+    entry = batch[0]['entry']
+    assert isinstance(entry, datetime.datetime)
+    assert entry.utcoffset() == datetime.timedelta(0)
+    assert (entry.year, entry.month, entry.day) == (2024, 1, 1)
+    assert isinstance(batch[0]['uuid'], uuid.UUID)
+
+
+def test_compact_record_keeps_raw_values(client):
+    batch = TaskBatch(TASKS, client)
+
+    assert batch[0].get_raw('due') == '20240201T120000Z'
+    assert batch[1].to_dict() == TASKS[1]
+    assert 'due' not in batch[1]
+
+
+def test_column_marshals_and_fills_missing_values(client):
+    batch = TaskBatch(TASKS, client)
+
+    due = batch.column('due')
+    assert isinstance(due[0], datetime.datetime)
+    assert due[1] is None
+
+
+def test_to_task_matches_client(client):
+    batch = TaskBatch(TASKS, client)
+
+    assert batch[0].to_task() == client._get_task_object(dict(TASKS[0]))
+
+
+def test_unmarshalled_client_returns_raw_values(client):
+    client._marshal = False
+    batch = TaskBatch(TASKS, client)
+
+    assert batch[0]['entry'] == '20240101T000000Z'
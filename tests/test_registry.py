@@ -0,0 +1,70 @@
+import sys
+
+from taskwarrior_capsules import registry
+from taskwarrior_capsules.capsule import CommandCapsule
+
+
+def test_fingerprint_ignores_script_directory(tmp_path, monkeypatch):
+    site = tmp_path / 'site-packages'
+    site.mkdir()
+    (site / 'example-1.0.dist-info').mkdir()
+    first = tmp_path / 'first'
+    first.mkdir()
+    second = tmp_path / 'second'
+    second.mkdir()
+
+    monkeypatch.setattr(sys, 'path', [str(first), str(site)])
+    fingerprint = registry.get_environment_fingerprint()
+    monkeypatch.setattr(sys, 'path', [str(second), str(site)])
+
+    assert registry.get_environment_fingerprint() == fingerprint
+
+
+def test_fingerprint_ignores_locations_without_distributions(tmp_path):
+    site = tmp_path / 'site-packages'
+    site.mkdir()
+    (site / 'example-1.0.dist-info').mkdir()
+    other = tmp_path / 'other'
+    other.mkdir()
+
+    fingerprint = registry.get_environment_fingerprint([str(site)])
+    (other / 'module.py').write_text('')
+
+    assert registry.get_environment_fingerprint(
+        [str(other), str(site)]
+    ) == fingerprint
+
+
+def test_fingerprint_changes_on_install(tmp_path):
+    site = tmp_path / 'site-packages'
+    site.mkdir()
+    fingerprint = registry.get_environment_fingerprint([str(site)])
+
+    (site / 'example-1.0.dist-info').mkdir()
+
+    assert registry.get_environment_fingerprint([str(site)]) != fingerprint
+
+
+class Subscribed(CommandCapsule):
+    COMMANDS = ['modify', 'add']
+
+
+class Decides(CommandCapsule):
+    COMMANDS = ['add']
+
+    @classmethod
+    def handles_command(cls, command_name):
+        return False
+
+
+class DecidesForAll(CommandCapsule):
+    @classmethod
+    def handles_command(cls, command_name):
+        return command_name == 'add'
+
+
+def test_subscriptions():
+    assert CommandCapsule.get_subscriptions() is None
+    assert Subscribed.get_subscriptions() == ['add', 'modify']
+    assert Decides.get_subscriptions() == ['add']
+    assert DecidesForAll.get_subscriptions() is None
@@ -0,0 +1,85 @@
+import pytest
+
+from taskwarrior_capsules.resolver import (
+    CommandResolver,
+    parse_obvious_args,
+)
+
+
+TASKWARRIOR = {
+    'commands': ['modify', 'mods', 'summary', 'next', 'list'],
+    'aliases': {'rm': 'delete', 'burndown': 'burndown.weekly', 'in': 'add +in'},
+    'abbreviation_minimum': 3,
+}
+
+
+@pytest.fixture
+def resolver():
+    return CommandResolver(TASKWARRIOR, ['capsules', 'sync'])
+
+
+@pytest.mark.parametrize('args, parsed', [
+    (['mod', '1'], ('', [], ['mod', '1'])),
+    (['1', 'modi', 'due:today'], ('modify', ['1'], ['due:today'])),
+    (['summ'], ('summary', [], [])),
+    (['caps'], ('capsules', [], [])),
+    (['next'], ('next', [], [])),
+])
+def test_abbreviations(resolver, args, parsed):
+    assert resolver.parse_args(args) == parsed
+
+
+def test_ambiguous_abbreviation_is_not_a_command(resolver):
+    # Both ``modify`` and ``mods`` start with ``mod``.
+    assert resolver.parse_args(['+home', 'mod']) == (
+        '', [], ['+home', 'mod'],
+    )
+
+
+def test_abbreviation_below_minimum_is_not_a_command(resolver):
+    assert resolver.parse_args(['su']) == ('', [], ['su'])
+
+
+def test_exact_name_wins_over_longer_names(resolver):
+    assert resolver.parse_args(['mods']) == ('mods', [], [])
+
+
+def test_alias_expands_into_extra_args(resolver):
+    assert resolver.parse_args(['in', 'Call Bob']) == (
+        'add', [], ['+in', 'Call Bob'],
+    )
+    assert resolver.parse_args(['2', 'rm']) == ('delete', ['2'], [])
+
+
+def test_alias_to_unknown_command_keeps_its_first_word(resolver):
+    assert resolver.parse_args(['burndown']) == ('burndown.weekly', [], [])
+
+
+def test_first_command_word_wins(resolver):
+    assert resolver.parse_args(['project:home', 'list', 'modify']) == (
+        'list', ['project:home'], ['modify'],
+    )
+
+
+def test_without_command(resolver):
+    assert resolver.parse_args(['+home']) == ('', [], ['+home'])
+
+
+@pytest.mark.parametrize('args, parsed', [
+    (['next'], ('next', [], [])),
+    (['+home', 'project:a', 'list'], ('list', ['+home', 'project:a'], [])),
+    (['1,3-4', 'modify', 'x'], ('modify', ['1,3-4'], ['x'])),
+    (['capsules', 'install'], ('capsules', [], ['install'])),
+    (['due.before:eow'], ('', [], ['due.before:eow'])),
+])
+def test_obvious_args(args, parsed):
+    assert parse_obvious_args(args, ['capsules']) == parsed
+
+
+@pytest.mark.parametrize('args', [
+    ['mod', '1'],
+    ['rm'],
+    ['homework', 'list'],
+])
+def test_args_needing_taskwarrior_are_not_obvious(args):
+    assert parse_obvious_args(args, ['capsules']) is None
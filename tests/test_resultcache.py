@@ -0,0 +1,91 @@
+import os
+import time
+
+from taskwarrior_capsules.capsule import CommandCapsule
+from taskwarrior_capsules.capsule_meta import CapsuleMeta
+from taskwarrior_capsules.lazy import LazyObject
+from taskwarrior_capsules.resultcache import ResultCache, get_data_fingerprint
+
+
+def report(lines):
+    for line in lines:
+        print(line)
+    return len(lines)
+
+
+def test_miss_then_hit(tmp_path, capsys):
+    cache = ResultCache(str(tmp_path))
+    calls = []
+
+    def handle():
+        calls.append(True)
+        return report(['one', 'two'])
+
+    assert cache.run('key', handle) == 2
+    assert cache.run('key', handle) == 2
+    assert cache.run('other', handle) == 2
+
+    assert len(calls) == 2
+    assert capsys.readouterr().out == 'one\ntwo\n' * 3
+
+
+def test_failures_are_not_cached(tmp_path):
+    cache = ResultCache(str(tmp_path))
+
+    def fail():
+        print('partial')
+        raise RuntimeError()
+
+    try:
+        cache.run('key', fail)
+    except RuntimeError:
+        pass
+
+    assert cache.load('key') is None
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    for key in ('a', 'b', 'c'):
+        cache.save(key, 'x' * 1000, None)
+        # Make the modification order unambiguous.
+        time.sleep(0.01)
+    cache.load('a')
+    cache.max_bytes = 2500
+
+    cache.evict()
+
+    assert cache.load('a') is not None
+    assert cache.load('b') is None
+    assert cache.load('c') is not None
+
+
+def test_fingerprint_changes_with_data(tmp_path):
+    pending = tmp_path / 'pending.data'
+    pending.write_text('')
+    fingerprint = get_data_fingerprint(str(tmp_path))
+
+    with pending.open('a') as out:
+        out.write('[description:"Water plants" status:"pending"]\n')
+
+    assert get_data_fingerprint(str(tmp_path)) != fingerprint
+
+
+class Report(CommandCapsule):
+    CACHE_RESULTS = True
+
+
+def test_state_does_not_set_up_client(home, monkeypatch):
+    def build():
+        raise AssertionError('The client was set up.')
+    data = home / 'tasks'
+    data.mkdir()
+    (data / 'pending.data').write_text('')
+    (home / '.taskrc').write_text('data.location=%s\n' % data)
+    capsule = Report(CapsuleMeta(), 'report', LazyObject(build))
+
+    state = capsule.get_result_cache_state()
+
+    assert [path for path, _ in state] == [
+        str(data / 'pending.data'), os.path.join(str(home), '.taskrc'),
+    ]
@@ -0,0 +1,74 @@
+import warnings
+
+import pytest
+
+from taskwarrior_capsules import capsule as capsule_module
+from taskwarrior_capsules.capsule import CommandCapsule
+from taskwarrior_capsules.capsule_meta import CapsuleMeta
+
+
+class Example(CommandCapsule):
+    MIN_VERSION = '0.1'
+    MAX_VERSION = '0.2'
+    MIN_TASKWARRIOR_VERSION = '2.3'
+    MAX_TASKWARRIOR_VERSION = '2.9'
+
+
+@pytest.fixture
+def probes(home, monkeypatch):
+    """ Counts ``task --version`` probes, reporting version 2.6.2. """
+    calls = []
+
+    def get_version_string(meta=None):
+        calls.append(True)
+        return '2.6.2'
+    monkeypatch.setattr(
+        capsule_module, 'get_taskwarrior_version_string', get_version_string,
+    )
+    monkeypatch.setattr(CommandCapsule, '_compatibility_cache', {})
+    return calls
+
+
+def validate():
+    capsule = Example(CapsuleMeta(), 'example', None)
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        capsule.validate(variant='command')
+    return [str(warning.message) for warning in caught]
+
+
+def test_verdicts_are_cached_in_process(probes, monkeypatch):
+    messages = validate()
+    computed = []
+    monkeypatch.setattr(
+        Example, 'get_compatibility_warnings',
+        lambda self: computed.append(True) or [],
+    )
+
+    assert validate() == messages
+    assert computed == []
+    assert len(messages) == 1
+    assert 'taskwarrior-capsules' in messages[0]
+
+
+def test_verdicts_are_cached_on_disk(probes, monkeypatch):
+    messages = validate()
+    monkeypatch.setattr(CommandCapsule, '_compatibility_cache', {})
+    computed = []
+    monkeypatch.setattr(
+        Example, 'get_compatibility_warnings',
+        lambda self: computed.append(True) or [],
+    )
+
+    assert validate() == messages
+    assert computed == []
+
+
+def test_verdicts_change_with_taskwarrior(probes, monkeypatch):
+    assert len(validate()) == 1
+    monkeypatch.setattr(
+        capsule_module, 'get_taskwarrior_version_string',
+        lambda meta=None: '3.0.0',
+    )
+
+    assert len(validate()) == 2